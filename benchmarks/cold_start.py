@@ -0,0 +1,91 @@
+"""Холодный старт API под server.py.
+
+Запускает server.py, ждёт первого ответа 200 и печатает время до
+готовности, задержку первых запросов к ленте и установившуюся задержку.
+Запуск повторяется с прогревом пула соединений (WEB_WARMUP) и без него.
+Нужна база с пользователем, под которым можно войти (см. seed.py).
+
+    cd src && python ../benchmarks/cold_start.py --username user0 \\
+        --password password
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def wait_ready(client: httpx.Client, deadline: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < deadline:
+        try:
+            if client.get("/docs").status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError("server did not become ready")
+
+
+def latencies_ms(client: httpx.Client, headers: dict, n: int) -> list[float]:
+    result = []
+    for _ in range(n):
+        started = time.perf_counter()
+        client.get("/api/v1/posts/", headers=headers).raise_for_status()
+        result.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def run(args: argparse.Namespace, warmup: bool) -> None:
+    env = {**os.environ, "WEB_WARMUP": str(warmup).lower()}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--bind", args.bind,
+         "--workers", str(args.workers)],
+        cwd=SRC, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    try:
+        # Новое соединение на каждый запрос, чтобы попадать в разные
+        # процессы, как запросы разных клиентов.
+        with httpx.Client(base_url=f"http://{args.bind}",
+                          limits=httpx.Limits(max_keepalive_connections=0),
+                          timeout=30) as client:
+            wait_ready(client, args.deadline)
+            ready = time.perf_counter() - started
+            token = client.post("/api/v1/users/login/", data={
+                "username": args.username, "password": args.password,
+            }).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            first = latencies_ms(client, headers, args.workers)
+            steady = latencies_ms(client, headers, args.requests)
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"{'on' if warmup else 'off':<8}{ready:>10.2f}"
+          f"{max(first):>12.1f}{statistics.median(steady):>12.1f}"
+          f"{statistics.quantiles(steady, n=100)[98]:>10.1f}")
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"{'warmup':<8}{'ready s':>10}{'first ms':>12}{'median ms':>12}"
+          f"{'p99 ms':>10}")
+    for warmup in (False, True):
+        run(args, warmup)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default="127.0.0.1:8099")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--deadline", type=float, default=60,
+                        help="seconds to wait for the server to start")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    main(parser.parse_args())
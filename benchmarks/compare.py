@@ -0,0 +1,71 @@
+"""Сравнение результатов run.py с базовым прогоном.
+
+Завершается с кодом 1, если хотя бы один сценарий деградировал сильнее
+допустимого: выросла задержка p50/p99, упала пропускная способность,
+выросло число SQL-запросов на HTTP-запрос или появились ошибки.
+
+    python benchmarks/compare.py results/baseline.json results/current.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: str) -> dict:
+    return json.loads(Path(path).read_text())["scenarios"]
+
+
+def compare(baseline: dict, current: dict,
+            args: argparse.Namespace) -> list[str]:
+    regressions = []
+    for name, base in baseline.items():
+        if name not in current:
+            regressions.append(f"{name}: missing from current run")
+            continue
+        now = current[name]
+        checks = [
+            ("p50_ms", now["p50_ms"] > base["p50_ms"] * (1 + args.latency)),
+            ("p99_ms", now["p99_ms"] > base["p99_ms"] * (1 + args.latency)),
+            ("rps", now["rps"] < base["rps"] * (1 - args.rps)),
+            ("sql_per_request",
+             now["sql_per_request"] > base["sql_per_request"] + args.sql),
+            ("errors", now["errors"] > base["errors"]),
+        ]
+        for metric, failed in checks:
+            if failed:
+                regressions.append(f"{name}: {metric} {base[metric]} -> "
+                                   f"{now[metric]}")
+    return regressions
+
+
+def print_table(baseline: dict, current: dict) -> None:
+    metrics = ("rps", "p50_ms", "p99_ms", "sql_per_request", "errors")
+    print(f"{'scenario':<16}" + "".join(f"{m:>24}" for m in metrics))
+    for name in sorted(baseline.keys() | current.keys()):
+        base = baseline.get(name, {})
+        now = current.get(name, {})
+        cells = "".join(
+            f"{str(base.get(m, '-')) + ' -> ' + str(now.get(m, '-')):>24}"
+            for m in metrics)
+        print(f"{name:<16}{cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="allowed relative latency growth")
+    parser.add_argument("--rps", type=float, default=0.2,
+                        help="allowed relative throughput drop")
+    parser.add_argument("--sql", type=float, default=0.1,
+                        help="allowed growth of SQL statements per request")
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    print_table(baseline, current)
+    regressions = compare(baseline, current, args)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,131 @@
+"""Проверка планов горячих запросов на данных из seed.py.
+
+Для каждого запроса выполняется EXPLAIN, и в плане не должно быть
+последовательного сканирования по крупным таблицам. Завершается с
+кодом 1, если такое сканирование найдено.
+
+    cd src && python ../benchmarks/explain.py
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from sqlalchemy import func, select, text, true  # noqa: E402
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+import app  # noqa: E402, F401
+from database import close_database, session_factory  # noqa: E402
+from files.models import FileModel  # noqa: E402
+from posts.models import Comment, Like, Post, TimelineEntry  # noqa: E402
+from posts.services import _COMMENT_COLUMNS, _posts_query  # noqa: E402
+from search.services import _FULLNAME_WORDS, _LOWER_USERNAME, \
+    _prefix_range  # noqa: E402
+from users.models import Chat, Message, Subscribe, User  # noqa: E402
+
+WATCHED_TABLES = {"posts", "likes", "comments", "media_files", "subscribes",
+                  "timeline", "messages", "chats", "users", "blobs"}
+
+
+def seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan["Node Type"] == "Seq Scan" \
+            and plan["Relation Name"] in WATCHED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def hot_queries(session) -> dict:
+    # Самые «тяжёлые» ключи: популярный автор, обсуждаемый пост.
+    author_id = await session.scalar(select(User.id).order_by(
+        User.count_subscribers.desc()).limit(1))
+    post_id = await session.scalar(select(Post.id).order_by(
+        Post.count_comments.desc()).limit(1))
+    sender_id, receiver_id = (await session.execute(select(
+        Message.sender_id, Message.receiver_id).limit(1))).first() \
+        or (author_id, author_id)
+    post_ids = list(await session.scalars(select(Post.id).order_by(
+        Post.id.desc()).limit(20)))
+    digest = await session.scalar(select(FileModel.digest).limit(1))
+    viewer = User(id=author_id)
+
+    posts = select(Post.id).where(Post.id.in_(post_ids)).subquery()
+    latest = select(*_COMMENT_COLUMNS).where(
+        Comment.post_id == posts.c.id).order_by(
+        Comment.id.desc()).limit(3).lateral()
+    return {
+        "feed": _posts_query(viewer).order_by(Post.id.desc()).limit(21),
+        "feed_by_author": _posts_query(viewer).where(
+            Post.author_id == author_id).order_by(Post.id.desc()).limit(21),
+        "post_images": select(FileModel).where(
+            FileModel.post_id.in_(post_ids)),
+        "file_by_digest": select(FileModel).where(
+            FileModel.digest == digest,
+            FileModel.extension == "jpg").limit(1),
+        "timeline": select(TimelineEntry.post_id).where(
+            TimelineEntry.user_id == author_id).order_by(
+            TimelineEntry.post_id.desc()).limit(21),
+        "comments": select(*_COMMENT_COLUMNS).where(
+            Comment.post_id == post_id).order_by(
+            Comment.id.desc()).limit(21),
+        "latest_comments": select(latest).select_from(posts).join(
+            latest, true()),
+        "post_likes": select(func.count()).where(Like.post_id == post_id),
+        "followers": select(Subscribe.subscriber_id).where(
+            Subscribe.author_id == author_id),
+        "chats": select(Chat.peer_id, Message.content).join(
+            Message, Message.id == Chat.last_message_id).where(
+            Chat.user_id == author_id).order_by(
+            Chat.last_message_id.desc()).limit(21),
+        "messages": select(Message.id).where(
+            Message.sender_id == sender_id,
+            Message.receiver_id == receiver_id).order_by(
+            Message.id.desc()).limit(51),
+        "search_username": select(User.id).where(
+            *_prefix_range("bench_user_1")).order_by(
+            _LOWER_USERNAME).limit(11),
+        "search_fullname": select(User.id).where(
+            _FULLNAME_WORDS.op("@@")(func.to_tsquery(
+                text("'simple'::regconfig"), "анна:*"))).order_by(
+            User.count_subscribers.desc()).limit(11),
+        "search_posts": select(Post.id).where(
+            Post.search_vector.op("@@")(func.websearch_to_tsquery(
+                text("'russian'::regconfig"), "тег17"))).order_by(
+            func.ts_rank_cd(Post.search_vector, func.websearch_to_tsquery(
+                text("'russian'::regconfig"), "тег17")).desc()).limit(21),
+    }
+
+
+async def main(verbose: bool) -> int:
+    failures = 0
+    async with session_factory() as session:
+        for name, query in (await hot_queries(session)).items():
+            sql = query.compile(dialect=postgresql.dialect(),
+                                compile_kwargs={"literal_binds": True})
+            connection = await session.connection()
+            plan = (await connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            plan = (json.loads(plan) if isinstance(plan, str)
+                    else plan)[0]["Plan"]
+            scans = seq_scans(plan)
+            if scans:
+                print(f"FAIL {name}: seq scan on {', '.join(scans)}")
+            else:
+                print(f"ok   {name}")
+            if verbose:
+                print(json.dumps(plan, indent=2))
+            failures += bool(scans)
+    await close_database()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true",
+                        help="print full plans")
+    sys.exit(asyncio.run(main(parser.parse_args().verbose)))
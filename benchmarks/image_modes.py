@@ -0,0 +1,63 @@
+"""Проверка уменьшенных копий для изображений в разных режимах Pillow.
+
+Для каждого режима (16- и 32-битные целые, float, палитра, CMYK и
+другие) создаёт файл, делает из него копию через ``render_variant`` и
+проверяет её размер. Завершается с кодом 1, если копию сделать не
+удалось.
+
+    cd src && python ../benchmarks/image_modes.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from PIL import Image  # noqa: E402
+
+from files.images import render_variant  # noqa: E402
+from settings import settings  # noqa: E402
+
+SIDE = 64
+# Режим изображения и формат, в котором он сохраняется без изменений.
+CASES = [("I;16", "PNG"), ("I", "TIFF"), ("F", "TIFF"), ("P", "PNG"),
+         ("CMYK", "JPEG"), ("1", "PNG"), ("L", "PNG"), ("LA", "PNG"),
+         ("RGB", "JPEG"), ("RGBA", "PNG")]
+
+
+def sample(mode: str) -> Image.Image:
+    image = Image.new(mode, (300, 200))
+    bands = len(image.getbands())
+    high = {"I;16": 60000, "I": 2 ** 20, "F": 1.5}.get(mode, 255)
+    for x in range(0, 300, 7):
+        value = high * x // 300 if mode != "F" else high * x / 300
+        image.putpixel((x, x % 200), value if bands == 1
+                       else (value,) * bands)
+    return image
+
+
+def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as root:
+        for mode, image_format in CASES:
+            source = Path(root) / f"source.{image_format.lower()}"
+            target = Path(root) / "variant"
+            sample(mode).save(source, format=image_format)
+            with Image.open(source) as opened:
+                opened_mode = opened.mode
+            try:
+                render_variant(source, target, SIDE)
+                with Image.open(target) as variant:
+                    ok = (variant.format.lower()
+                          == settings.IMAGE_VARIANT_FORMAT.lower()
+                          and max(variant.size) == SIDE)
+                    detail = f"{variant.mode} {variant.size}"
+            except Exception as e:
+                ok, detail = False, repr(e)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {opened_mode:<5} {detail}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Пропускная способность входа в систему на одном процессе.
+
+Запускает приложение в процессе через httpx.ASGITransport, выполняет
+заданное число входов с заданной конкурентностью и одновременно
+измеряет задержку лёгкого эндпоинта, чтобы было видно, не блокирует ли
+проверка пароля цикл событий.
+
+    cd src && python ../benchmarks/login_throughput.py --logins 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import httpx  # noqa: E402
+
+USERNAME = "bench_login"
+PASSWORD = "bench_password"
+
+
+async def ensure_user(client: httpx.AsyncClient) -> None:
+    await client.post("/api/v1/users/signup/", json={
+        "username": USERNAME, "fullname": USERNAME, "password": PASSWORD,
+        "password_repeat": PASSWORD, "birthday": None, "bio": ""})
+
+
+async def login(client: httpx.AsyncClient, latencies: list[float]) -> None:
+    started = time.perf_counter()
+    response = await client.post("/api/v1/users/login/", data={
+        "username": USERNAME, "password": PASSWORD})
+    response.raise_for_status()
+    latencies.append(time.perf_counter() - started)
+
+
+async def probe(client: httpx.AsyncClient, done: asyncio.Event,
+                latencies: list[float]) -> None:
+    while not done.is_set():
+        started = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+async def main(logins: int, concurrency: int) -> None:
+    from app import app
+    from database import close_database
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url="http://bench") as client:
+        await ensure_user(client)
+        semaphore = asyncio.Semaphore(concurrency)
+        login_latencies: list[float] = []
+        probe_latencies: list[float] = []
+
+        async def limited() -> None:
+            async with semaphore:
+                await login(client, login_latencies)
+
+        done = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, done,
+                                               probe_latencies))
+        started = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+    await close_database()
+
+    print(f"logins/s:        {logins / elapsed:.1f}")
+    print(f"login p50/p99:   {percentile(login_latencies, 50):.1f} / "
+          f"{percentile(login_latencies, 99):.1f} ms")
+    print(f"probe p50/p99:   {percentile(probe_latencies, 50):.1f} / "
+          f"{percentile(probe_latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    # Все входы идут от одного пользователя, и ограничение частоты
+    # отклонило бы их после первого десятка; ограничения создаются при
+    # импорте приложения.
+    os.environ["RATE_LIMITS"] = "{}"
+    asyncio.run(main(args.logins, args.concurrency))
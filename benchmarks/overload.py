@@ -0,0 +1,95 @@
+"""Задержка под всплеском нагрузки с защитой от перегрузки и без неё.
+
+Запускает приложение в процессе через httpx.ASGITransport с маленьким
+пулом соединений и держит --concurrency одновременных клиентов, которые
+в течение --duration секунд запрашивают --path. Печатает число принятых
+и отклонённых (503) запросов и задержку принятых. Без защиты все запросы
+стоят в очереди к пулу, и задержка растёт вместе с очередью; с защитой
+лишние запросы сразу получают 503, а принятые обслуживаются быстро.
+Клиенты повторяют отклонённый запрос через Retry-After.
+Нужна база с данными из seed.py.
+
+    cd src && python ../benchmarks/overload.py --pool 2 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+
+async def load(client, args: argparse.Namespace,
+               headers: dict) -> tuple[list[float], int]:
+    accepted: list[float] = []
+    shed = 0
+    deadline = time.perf_counter() + args.duration
+
+    async def user() -> None:
+        nonlocal shed
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get(args.path, headers=headers)
+            if response.status_code == 503:
+                shed += 1
+                # Разброс, чтобы повторы не приходили одной волной.
+                await asyncio.sleep(float(response.headers["Retry-After"])
+                                    * random.uniform(0.5, 1.5))
+                continue
+            response.raise_for_status()
+            accepted.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(user() for _ in range(args.concurrency)))
+    return accepted, shed
+
+
+async def main(args: argparse.Namespace) -> None:
+    import httpx
+    from sqlalchemy import select
+
+    from app import app
+    from database import close_database, session_factory
+    from settings import settings
+    from users.models import User
+    from users.tokens import create_access_token
+
+    async with session_factory() as session:
+        username = await session.scalar(select(User.username).limit(1))
+    headers = {"Authorization": "Bearer " + create_access_token(
+        {"sub": username})}
+    modes = {
+        "off": {"ADMISSION_MAX_IN_FLIGHT": 10 ** 9,
+                "ADMISSION_MAX_POOL_WAIT": float("inf")},
+        "on": {"ADMISSION_MAX_IN_FLIGHT": settings.ADMISSION_MAX_IN_FLIGHT,
+               "ADMISSION_MAX_POOL_WAIT": settings.ADMISSION_MAX_POOL_WAIT},
+    }
+    print(f"{'mode':<6}{'accepted':>10}{'shed':>8}{'p50 ms':>10}"
+          f"{'p99 ms':>10}{'max ms':>10}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://bench/api/v1") as client:
+        for mode, overrides in modes.items():
+            for name, value in overrides.items():
+                setattr(settings, name, value)
+            accepted, shed = await load(client, args, headers)
+            percentiles = statistics.quantiles(accepted, n=100)
+            print(f"{mode:<6}{len(accepted):>10}{shed:>8}"
+                  f"{statistics.median(accepted):>10.1f}"
+                  f"{percentiles[98]:>10.1f}{max(accepted):>10.1f}")
+    await close_database()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/posts/timeline/")
+    parser.add_argument("--pool", type=int, default=2,
+                        help="database connections of the app")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    # Настройки читаются при импорте приложения.
+    os.environ.update(DB_POOL_SIZE=str(args.pool), DB_MAX_OVERFLOW="0")
+    asyncio.run(main(args))
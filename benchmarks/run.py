@@ -0,0 +1,251 @@
+"""Нагрузочный прогон типовых сценариев API.
+
+Запускает приложение в процессе через httpx.ASGITransport на данных из
+seed.py и для каждого сценария измеряет пропускную способность,
+перцентили задержки, число ошибок и число SQL-запросов на HTTP-запрос.
+Результат сохраняется в JSON для сравнения через compare.py.
+
+    cd src && python ../benchmarks/run.py --name baseline
+"""
+import argparse
+import asyncio
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app import app  # noqa: E402
+from database import close_database, session_factory  # noqa: E402
+from metrics import REQUEST_SQL_STATEMENTS  # noqa: E402
+from posts.models import Post  # noqa: E402
+from users.models import User  # noqa: E402
+from users.services import create_access_token  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def _image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), (40, 120, 200)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+IMAGE = _image()
+
+Request = Callable[[httpx.AsyncClient, random.Random],
+                   Awaitable[httpx.Response]]
+
+
+class Workload:
+    def __init__(self, users: int, posts: int, media: list[str]) -> None:
+        self.users = users
+        self.posts = posts
+        self.media = media
+        self.tokens: dict[int, str] = {}
+
+    def headers(self, rng: random.Random) -> dict[str, str]:
+        user_id = rng.randint(1, self.users)
+        if user_id not in self.tokens:
+            self.tokens[user_id] = create_access_token(
+                {"sub": f"bench_user_{user_id}"}, 60)
+        return {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+    def scenarios(self) -> dict[str, Request]:
+        def feed(client, rng):
+            return client.get("/api/v1/posts/", headers=self.headers(rng))
+
+        def user_feed(client, rng):
+            return client.get("/api/v1/posts/", headers=self.headers(rng),
+                              params={"user_id": rng.randint(1, self.users)})
+
+        def timeline(client, rng):
+            return client.get("/api/v1/posts/timeline/",
+                              headers=self.headers(rng))
+
+        def comments(client, rng):
+            post_id = rng.randint(1, self.posts)
+            return client.get(f"/api/v1/posts/{post_id}/comments/",
+                              headers=self.headers(rng))
+
+        def latest_comments(client, rng):
+            post_ids = rng.sample(range(1, self.posts + 1),
+                                  min(20, self.posts))
+            return client.get("/api/v1/posts/comments/latest/",
+                              headers=self.headers(rng),
+                              params={"post_ids": post_ids})
+
+        def search_users(client, rng):
+            prefix = rng.choice(("bench_user_", "Анна", "ива", "смир",
+                                 "пёт", "b", "bench_user_1"))
+            return client.get("/api/v1/search/users/",
+                              headers=self.headers(rng),
+                              params={"q": prefix[:rng.randint(1, 12)]})
+
+        def search_posts(client, rng):
+            return client.get("/api/v1/search/posts/",
+                              headers=self.headers(rng),
+                              params={"q": rng.choice(("закат", "кофе море",
+                                                       "travel", "горы"))})
+
+        def media(client, rng):
+            return client.get(rng.choice(self.media))
+
+        def thumbnail(client, rng):
+            return client.get(rng.choice(self.media),
+                              params={"size": "thumb"})
+
+        def create_post(client, rng):
+            return client.post("/api/v1/posts/create/",
+                               headers=self.headers(rng),
+                               data={"content": "benchmark"},
+                               files=[("files", ("bench.jpg", IMAGE,
+                                                 "image/jpeg"))])
+
+        return {
+            "feed": feed,
+            "user_feed": user_feed,
+            "timeline": timeline,
+            "comments": comments,
+            "latest_comments": latest_comments,
+            "search_users": search_users,
+            "search_posts": search_posts,
+            "media": media,
+            "thumbnail": thumbnail,
+            # Пишущий сценарий идёт последним, чтобы не менять данные
+            # для читающих.
+            "create_post": create_post,
+        }
+
+
+def sql_totals() -> tuple[float, float]:
+    # Последние два значения гистограммы — сумма и количество.
+    values = REQUEST_SQL_STATEMENTS.values.values()
+    return (sum(counts[-2] for counts in values),
+            sum(counts[-1] for counts in values))
+
+
+def percentile(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] * 1000 if values else 0.0
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+async def run_scenario(client: httpx.AsyncClient, request: Request,
+                       requests: int, concurrency: int,
+                       rng: random.Random) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    queue = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in queue:
+            started = time.perf_counter()
+            response = await request(client, rng)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    statements, observed = sql_totals()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    statements_after, observed_after = sql_totals()
+
+    return {
+        "requests": requests,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "errors": errors,
+        "sql_per_request": round((statements_after - statements)
+                                 / max(observed_after - observed, 1), 2),
+    }
+
+
+async def load_workload(client: httpx.AsyncClient) -> Workload:
+    async with session_factory() as session:
+        users = await session.scalar(select(func.count(User.id)))
+        posts = await session.scalar(select(func.max(Post.id)))
+    if not users or not posts:
+        raise SystemExit("no data, run benchmarks/seed.py first")
+    workload = Workload(users, posts, [])
+    response = await client.get("/api/v1/posts/", params={"limit": 100},
+                                headers=workload.headers(random.Random()))
+    response.raise_for_status()
+    workload.media = [variants["original"]
+                      for post in response.json()["posts"]
+                      for variants in post["image_variants"]]
+    return workload
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> None:
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url="http://bench") as client:
+        workload = await load_workload(client)
+        scenarios = workload.scenarios()
+        selected = args.scenario or list(scenarios)
+        for name in selected:
+            rng = random.Random(args.seed)
+            # Прогрев: соединения пула, кеши, ленивые варианты картинок.
+            await run_scenario(client, scenarios[name], args.warmup,
+                               args.concurrency, rng)
+            results[name] = await run_scenario(
+                client, scenarios[name], args.requests, args.concurrency,
+                rng)
+            print(name, results[name])
+    await close_database()
+
+    report = {
+        "meta": {
+            "name": args.name,
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{args.name}.json"
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--name", default="current")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append",
+                        help="run only the given scenario, repeatable")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Проверка хранилища S3Backend на S3 внутри процесса (moto).
+
+Сохраняет объект, проверяет его заголовки, наличие, скачивание, адреса
+и удаление. Сеть и настоящий бакет не нужны. Завершается с кодом 1,
+если какая-то проверка не прошла.
+
+    cd src && python ../benchmarks/s3_storage.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import boto3  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+from files.backends import S3Backend, shard  # noqa: E402
+from settings import settings  # noqa: E402
+
+BUCKET = "fotogram-check"
+REGION = "us-east-1"
+
+
+async def check(root: Path) -> list[str]:
+    failures = []
+
+    def expect(name: str, ok: bool) -> None:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            failures.append(name)
+
+    backend = S3Backend(BUCKET, region=REGION)
+    client = boto3.client("s3", region_name=REGION)
+    client.create_bucket(Bucket=BUCKET)
+    key = shard("ab" * 32)
+    source = root / "source.tmp"
+    source.write_bytes(b"image bytes")
+
+    await backend.save(key, source, "image/png")
+    head = client.head_object(Bucket=BUCKET, Key=key)
+    expect("save removes the local file", not source.exists())
+    expect("save sets Content-Type", head["ContentType"] == "image/png")
+    expect("save sets Cache-Control", head["CacheControl"] ==
+           f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable")
+    expect("exists", await backend.exists(key))
+    expect("missing object does not exist",
+           not await backend.exists(key + "_missing"))
+
+    target = root / "target.tmp"
+    await backend.fetch(key, target)
+    expect("fetch", target.read_bytes() == b"image bytes")
+    expect("no local path", backend.path(key) is None)
+    expect("presigned url", BUCKET in backend.url(key)
+           and "Signature" in backend.url(key))
+    public = S3Backend(BUCKET, region=REGION,
+                       public_url="https://cdn.example.com/")
+    expect("public url",
+           public.url(key) == f"https://cdn.example.com/{key}")
+
+    await backend.delete(key)
+    expect("delete", not await backend.exists(key))
+    await backend.delete(key)
+    expect("delete of a missing object", True)
+    return failures
+
+
+def main() -> int:
+    # moto принимает любые ключи, настоящие не должны попасть в запросы.
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ[name] = "testing"
+    with mock_aws(), tempfile.TemporaryDirectory() as root:
+        failures = asyncio.run(check(Path(root)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
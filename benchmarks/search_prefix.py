@@ -0,0 +1,62 @@
+"""Проверка поиска по началу логина на крайних символах Юникода.
+
+В транзакции, которая затем откатывается, создаёт пользователей с
+логинами около U+D7FF, U+E000 и U+10FFFF и сравнивает найденных по
+диапазону ``_prefix_range`` с проверкой ``startswith``. Завершается с
+кодом 1 при расхождении.
+
+    cd src && python ../benchmarks/search_prefix.py
+"""
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from sqlalchemy import insert, select  # noqa: E402
+
+import app  # noqa: E402, F401
+from database import close_database, session_factory  # noqa: E402
+from search.services import _prefix_range  # noqa: E402
+from users.models import User  # noqa: E402
+
+MAX = chr(0x10FFFF)
+BEFORE_SURROGATES = chr(0xD7FF)
+AFTER_SURROGATES = chr(0xE000)
+
+P = "prefix_check_"
+
+USERNAMES = [P + "a", P + "b", P + BEFORE_SURROGATES, P + AFTER_SURROGATES,
+             P + MAX, P + MAX + "a", P + MAX + MAX, "prefix_checl",
+             MAX, MAX + "a", MAX + MAX, BEFORE_SURROGATES + "x",
+             AFTER_SURROGATES]
+PREFIXES = [P, P + BEFORE_SURROGATES, P + MAX, P + MAX + MAX,
+            MAX, MAX + MAX, BEFORE_SURROGATES, AFTER_SURROGATES]
+
+
+async def main() -> int:
+    failures = 0
+    now = datetime.now()
+    async with session_factory() as session:
+        ids = list(await session.scalars(insert(User).returning(User.id), [
+            {"username": name, "fullname": "", "password": "", "bio": "",
+             "signup_at": now, "last_activity": now}
+            for name in USERNAMES]))
+        for prefix in PREFIXES:
+            found = set(await session.scalars(
+                select(User.username).where(*_prefix_range(prefix)).where(
+                    User.id.in_(ids))))
+            expected = {name for name in USERNAMES
+                        if name.startswith(prefix)}
+            status = "ok  " if found == expected else "FAIL"
+            failures += found != expected
+            print(f"{status} {prefix.encode('unicode_escape').decode()}: "
+                  f"{len(found)} of {len(expected)}")
+        await session.rollback()
+    await close_database()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
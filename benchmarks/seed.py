@@ -0,0 +1,246 @@
+"""Генератор синтетических данных для бенчмарков.
+
+Создаёт пользователей со степенным распределением подписчиков, посты с
+изображениями, лайки и комментарии, заполняет ленты подписок и
+денормализованные счётчики. Все существующие данные удаляются.
+
+    cd src && python ../benchmarks/seed.py --users 1000 --seed 1
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import random
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from PIL import Image  # noqa: E402
+from passlib.context import CryptContext  # noqa: E402
+from sqlalchemy import func, insert, select, text, union_all, \
+    update  # noqa: E402
+
+import app  # noqa: E402, F401
+from database import Base, close_database, get_engine, \
+    session_factory  # noqa: E402
+from files.backends import storage  # noqa: E402
+from files.models import Blob, FileModel  # noqa: E402
+from files.storage import blob_key  # noqa: E402
+from posts.models import Comment, Like, Post, TimelineEntry  # noqa: E402
+from settings import settings  # noqa: E402
+from users.models import Chat, Message, Subscribe, User  # noqa: E402
+
+PASSWORD = "bench_password"
+BATCH = 5000
+POPULAR_IMAGES = 20
+DUPLICATE_SHARE = 0.1
+FIRST_NAMES = ("Анна", "Борис", "Вера", "Глеб", "Дарья", "Егор", "Жанна",
+               "Иван", "Ксения", "Лев", "Мария", "Никита", "Ольга", "Пётр")
+LAST_NAMES = ("Смирнов", "Иванов", "Кузнецов", "Попов", "Васильев",
+              "Петров", "Соколов", "Михайлов", "Новиков", "Фёдоров")
+WORDS = ("закат", "море", "горы", "кофе", "город", "кот", "собака", "лес",
+         "утро", "дорога", "друзья", "концерт", "отпуск", "снег", "sunset",
+         "travel", "food", "street", "portrait", "nature")
+
+
+def power_law_weights(n: int, alpha: float) -> list[float]:
+    return [1 / (rank ** alpha) for rank in range(1, n + 1)]
+
+
+def sample_unique(rng: random.Random, population: list[int],
+                  weights: list[float], k: int) -> set[int]:
+    k = min(k, len(population))
+    chosen: set[int] = set()
+    while len(chosen) < k:
+        chosen.update(rng.choices(population, weights, k=k - len(chosen)))
+    return chosen
+
+
+def image_bytes(color: tuple[int, int, int]) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+async def store_image(data: bytes, images: dict[str, int]) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    if digest not in images:
+        path = storage.path(blob_key(digest))
+        if path is None:
+            path = settings.PATH_FILES / f".{digest}.tmp"
+            path.write_bytes(data)
+            await storage.save(blob_key(digest), path, "image/jpeg")
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        images[digest] = len(data)
+    return digest
+
+
+async def insert_batches(session, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), BATCH):
+        await session.execute(insert(model), rows[start:start + BATCH])
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    now = datetime.now()
+    password = CryptContext(schemes=["bcrypt"],
+                            bcrypt__rounds=4).hash(PASSWORD)
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+
+    async with session_factory() as session:
+        await session.execute(text(
+            f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+        await insert_batches(session, User, [{
+            "username": f"bench_user_{i}",
+            "fullname": f"{rng.choice(FIRST_NAMES)} "
+                        f"{rng.choice(LAST_NAMES)}",
+            "password": password,
+            "bio": "",
+            "signup_at": now - timedelta(days=365),
+            "last_activity": now,
+        } for i in range(1, args.users + 1)])
+        user_ids = list(range(1, args.users + 1))
+        popularity = power_law_weights(args.users, args.alpha)
+
+        subscribes = []
+        for subscriber_id in user_ids:
+            count = min(int(rng.paretovariate(1.5) * args.follows / 3),
+                        args.users - 1)
+            for author_id in sample_unique(rng, user_ids, popularity, count):
+                if author_id != subscriber_id:
+                    subscribes.append({"subscriber_id": subscriber_id,
+                                       "author_id": author_id})
+        await insert_batches(session, Subscribe, subscribes)
+
+        posts = []
+        for author_id in user_ids:
+            for _ in range(rng.randint(0, 2 * args.posts)):
+                posts.append({
+                    "author_id": author_id,
+                    "content": " ".join([
+                        *rng.choices(WORDS, k=rng.randint(3, 12)),
+                        f"тег{rng.randint(1, 2000)}"]),
+                    "created_at": now - timedelta(
+                        minutes=rng.randint(0, 60 * 24 * 30)),
+                })
+        posts.sort(key=lambda post: post["created_at"])
+        await insert_batches(session, Post, posts)
+        post_ids = list(range(1, len(posts) + 1))
+        post_popularity = power_law_weights(len(post_ids), args.alpha)
+        rng.shuffle(post_popularity)
+
+        # Большинство загрузок уникальны: байты после маркера конца JPEG
+        # меняют хэш, но не картинку. Остальные повторяют популярные
+        # изображения и проверяют дедупликацию.
+        settings.PATH_FILES.mkdir(exist_ok=True)
+        data = image_bytes((200, 120, 40))
+        images: dict[str, int] = {}
+        popular = [await store_image(data + bytes([i]), images)
+                   for i in range(POPULAR_IMAGES)]
+        files = []
+        for post_id in post_ids:
+            for _ in range(rng.randint(1, 3)):
+                if rng.random() < DUPLICATE_SHARE:
+                    digest = rng.choice(popular)
+                else:
+                    digest = await store_image(
+                        data + rng.randbytes(16), images)
+                files.append({"uuid": uuid.UUID(int=rng.getrandbits(128)),
+                              "extension": "jpg", "post_id": post_id,
+                              "digest": digest})
+        ref_counts = Counter(file["digest"] for file in files)
+        await insert_batches(session, Blob, [
+            {"digest": digest, "size": size,
+             "ref_count": ref_counts[digest]}
+            for digest, size in images.items()])
+        await insert_batches(session, FileModel, files)
+
+        likes = set()
+        for _ in range(args.likes):
+            likes.add((rng.choice(user_ids),
+                       rng.choices(post_ids, post_popularity)[0]))
+        await insert_batches(session, Like, [
+            {"user_id": user_id, "post_id": post_id}
+            for user_id, post_id in likes])
+
+        await insert_batches(session, Comment, [{
+            "user_id": rng.choice(user_ids),
+            "post_id": rng.choices(post_ids, post_popularity)[0],
+            "content": "comment",
+            "created_at": now,
+        } for _ in range(args.comments)])
+
+        messages = []
+        for _ in range(args.messages):
+            edge = rng.choice(subscribes)
+            sender_id, receiver_id = edge["subscriber_id"], edge["author_id"]
+            if rng.random() < 0.5:
+                sender_id, receiver_id = receiver_id, sender_id
+            messages.append({"sender_id": sender_id,
+                             "receiver_id": receiver_id,
+                             "content": "message", "timestamp": now})
+        await insert_batches(session, Message, messages)
+        sides = union_all(
+            select(Message.sender_id.label("user_id"),
+                   Message.receiver_id.label("peer_id"), Message.id),
+            select(Message.receiver_id, Message.sender_id, Message.id),
+        ).subquery()
+        await session.execute(insert(Chat).from_select(
+            ["user_id", "peer_id", "last_message_id"],
+            select(sides.c.user_id, sides.c.peer_id, func.max(sides.c.id))
+            .group_by(sides.c.user_id, sides.c.peer_id)))
+
+        count_subscribers = select(func.count()).where(
+            Subscribe.author_id == User.id).correlate(User).scalar_subquery()
+        await session.execute(update(User).values(
+            count_subscribers=count_subscribers))
+        await session.execute(update(Post).values(
+            count_likes=select(func.count()).where(
+                Like.post_id == Post.id).correlate(Post).scalar_subquery(),
+            count_comments=select(func.count()).where(
+                Comment.post_id == Post.id).correlate(Post).scalar_subquery(),
+        ))
+        await session.execute(insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id"],
+            select(Post.author_id, Post.id, Post.author_id)))
+        await session.execute(insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id"],
+            select(Subscribe.subscriber_id, Post.id, Post.author_id).join(
+                Post, Post.author_id == Subscribe.author_id).join(
+                User, User.id == Subscribe.author_id).where(
+                User.count_subscribers <= settings.TIMELINE_FANOUT_LIMIT)))
+        await session.commit()
+    # VACUUM переносит новые строки из списка ожидания GIN-индексов в сам
+    # индекс: пока список полон, планировщик считает индекс дорогим и
+    # выбирает последовательное сканирование.
+    async with get_engine().connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text(f"VACUUM ANALYZE {tables}"))
+    await close_database()
+
+    print(f"users={args.users} subscribes={len(subscribes)} "
+          f"posts={len(posts)} files={len(files)} likes={len(likes)} "
+          f"comments={args.comments} messages={args.messages}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=30,
+                        help="typical number of followed authors")
+    parser.add_argument("--posts", type=int, default=5,
+                        help="average posts per user")
+    parser.add_argument("--likes", type=int, default=50000)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--alpha", type=float, default=1.1,
+                        help="power-law exponent of popularity")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(seed(parser.parse_args()))
@@ -0,0 +1,141 @@
+"""Микробенчмарк сериализации ленты и комментариев.
+
+Сравнивает прежний путь (модель pydantic на каждую строку, затем
+валидация по response_model и кодирование через jsonable_encoder и json)
+с новым (словари из строк и один проход orjson). Печатает стоимость
+одного элемента в микросекундах и проверяет, что оба пути дают
+одинаковый JSON.
+
+    cd src && python ../benchmarks/serialization.py --items 20 100 500
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from files.images import variant_urls  # noqa: E402
+from files.models import FileModel  # noqa: E402
+from posts.schemas import CommentWithOwnerSchema, CommentsOutputSchema, \
+    PostSchema, ResponsePostsSchema  # noqa: E402
+from posts.services import _comment_item, _post_item  # noqa: E402
+from users.models import User  # noqa: E402
+from users.schemas import UserSchema  # noqa: E402
+
+PostRow = namedtuple("PostRow", "id content author_id author_name "
+                                "created_at count_likes liked "
+                                "count_comments status")
+CommentRow = namedtuple("CommentRow", "id user_id post_id content "
+                                      "created_at")
+NOW = datetime(2026, 10, 18, 12, 30, 15, 123456)
+VIEWER = User(id=1)
+USER = {"username": "user", "fullname": "Имя Фамилия",
+        "birthday": None, "signup_at": NOW, "last_activity": NOW,
+        "bio": "о себе", "avatar": None}
+
+
+def make_posts(n: int) -> list[tuple[PostRow, list[FileModel]]]:
+    return [(PostRow(id=i, content="закат над морем #travel " * 3,
+                     author_id=i % 50, author_name=f"user{i % 50}",
+                     created_at=NOW - timedelta(minutes=i),
+                     count_likes=i * 7, liked=i % 3 == 0,
+                     count_comments=i % 11, status="ready"),
+             [FileModel(digest=f"{i:064x}", extension="jpg")
+              for _ in range(1 + i % 3)])
+            for i in range(n)]
+
+
+def make_comments(n: int) -> list[CommentRow]:
+    return [CommentRow(id=i, user_id=i % 20, post_id=1,
+                       content="отличное фото!", created_at=NOW)
+            for i in range(n)]
+
+
+async def posts_pydantic(posts) -> bytes:
+    field = create_response_field("Response_posts", ResponsePostsSchema)
+    content = ResponsePostsSchema(posts=[
+        PostSchema(id=row.id,
+                   images=[file.get_filename() for file in files],
+                   image_variants=[variant_urls(file) for file in files],
+                   content=row.content, author_id=row.author_id,
+                   author_name=row.author_name,
+                   created_at=row.created_at, count_likes=row.count_likes,
+                   liked=row.liked, count_comments=row.count_comments,
+                   status=row.status)
+        for row, files in posts], next_cursor=None)
+    return JSONResponse(await serialize_response(
+        field=field, response_content=content)).body
+
+
+async def posts_orjson(posts) -> bytes:
+    return ORJSONResponse({
+        "posts": [_post_item(row, files) for row, files in posts],
+        "next_cursor": None}).body
+
+
+async def comments_pydantic(rows) -> bytes:
+    field = create_response_field("Response_comments", CommentsOutputSchema)
+    content = CommentsOutputSchema(
+        comments=[CommentWithOwnerSchema(
+            id=row.id, user_id=row.user_id, post_id=row.post_id,
+            content=row.content, created_at=row.created_at,
+            owner=row.user_id == VIEWER.id) for row in rows],
+        users={row.user_id: UserSchema(**USER) for row in rows},
+        next_cursor=None)
+    return JSONResponse(await serialize_response(
+        field=field, response_content=content)).body
+
+
+async def comments_orjson(rows) -> bytes:
+    return ORJSONResponse({
+        "comments": [_comment_item(VIEWER, row) for row in rows],
+        "users": {row.user_id: USER for row in rows},
+        "next_cursor": None}).body
+
+
+async def per_item_us(encode, data, n: int, min_time: float) -> float:
+    loops = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < min_time:
+        await encode(data)
+        loops += 1
+    return elapsed / loops / n * 1e6
+
+
+async def main(args: argparse.Namespace) -> int:
+    cases = (("posts", make_posts, posts_pydantic, posts_orjson),
+             ("comments", make_comments, comments_pydantic,
+              comments_orjson))
+    failures = 0
+    print(f"{'case':<10}{'items':>7}{'pydantic us':>14}{'orjson us':>12}"
+          f"{'speedup':>9}")
+    for name, make, old, new in cases:
+        for n in args.items:
+            data = make(n)
+            if json.loads(await old(data)) != json.loads(await new(data)):
+                print(f"FAIL {name}: outputs differ")
+                failures += 1
+                continue
+            old_us = await per_item_us(old, data, n, args.min_time)
+            new_us = await per_item_us(new, data, n, args.min_time)
+            print(f"{name:<10}{n:>7}{old_us:>14.2f}{new_us:>12.2f}"
+                  f"{old_us / new_us:>8.1f}x")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+",
+                        default=[20, 100, 500])
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="seconds to run each measurement")
+    sys.exit(asyncio.run(main(parser.parse_args())))
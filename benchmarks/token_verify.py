@@ -0,0 +1,79 @@
+"""Микробенчмарк проверки токена доступа.
+
+Сравнивает полную проверку JWT (разбор, проверка подписи и exp) для
+HS256 и ES256 с попаданием в кэш проверенных токенов. Печатает
+стоимость одной проверки в микросекундах.
+
+    cd src && python ../benchmarks/token_verify.py
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from jose import jwt  # noqa: E402
+
+from users.tokens import create_access_token, \
+    verify_access_token  # noqa: E402
+
+
+def es256_keys() -> tuple[bytes, bytes]:
+    private = ec.generate_private_key(ec.SECP256R1())
+    return (
+        private.private_bytes(serialization.Encoding.PEM,
+                              serialization.PrivateFormat.PKCS8,
+                              serialization.NoEncryption()),
+        private.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo),
+    )
+
+
+def per_call_us(verify, min_time: float) -> float:
+    loops = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < min_time:
+        verify()
+        loops += 1
+    return elapsed / loops * 1e6
+
+
+async def cached_us(token: str, min_time: float) -> float:
+    assert await verify_access_token(token) is not None
+    loops = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < min_time:
+        await verify_access_token(token)
+        loops += 1
+    return elapsed / loops * 1e6
+
+
+async def main(args: argparse.Namespace) -> int:
+    claims = {"sub": "user",
+              "exp": datetime.now(UTC) + timedelta(minutes=15)}
+    private, public = es256_keys()
+    cases = (("HS256", "secret" * 8, "secret" * 8),
+             ("ES256", private, public))
+    print(f"{'algorithm':<12}{'decode us':>12}")
+    for algorithm, signing_key, verification_key in cases:
+        token = jwt.encode(claims, signing_key, algorithm=algorithm)
+        us = per_call_us(lambda: jwt.decode(
+            token, verification_key, algorithms=[algorithm]), args.min_time)
+        print(f"{algorithm:<12}{us:>12.2f}")
+    # Попадание в кэш не зависит от алгоритма: ключ записи — хэш токена.
+    token = create_access_token({"sub": "user"})
+    print(f"{'cached':<12}{await cached_us(token, args.min_time):>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="seconds to run each measurement")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,20 +1,72 @@
-"""Модуль для запуска FASTAPI."""
+"""Модуль для запуска FASTAPI.
+
+Для одного процесса достаточно ``uvicorn app:app``, в продакшене
+приложение запускает server.py.
+"""
+import logging
+import os
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse
 
-import os
-
+from cache import caches
+from database import close_database, get_engine, replicas, \
+    warm_up_pool
+from events import hub
 from files.routing import router as files_router
+from jobs.queue import Worker
+from limits import AdmissionMiddleware, RateLimitMiddleware
+from metrics import STARTUP_SECONDS, MetricsMiddleware, render_metrics
+from posts import jobs as post_jobs  # noqa: F401
+from posts.feed_cache import version_sync
 from posts.routing import router as posts_router
+from search.routing import router as search_router
 from settings import settings
 from users.routing import router as users_router
+from users.services import shutdown_hashing, start_hashing
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(fastapi_app: FastAPI) -> AsyncIterator[None]:
+    """Ресурсы процесса: готовы до первого запроса, закрыты после всех."""
+    started = time.perf_counter()
+    settings.PATH_FILES.mkdir(parents=True, exist_ok=True)
+    get_engine()
+    start_hashing()
+    if settings.WEB_WARMUP:
+        await warm_up_pool()
+    await replicas.start()
+    await version_sync.start()
+    # Без отдельного worker.py задачи выполняет сам процесс API.
+    worker = Worker() if settings.JOBS_EMBEDDED_WORKER else None
+    if worker is not None:
+        await worker.start()
+    elapsed = time.perf_counter() - started
+    STARTUP_SECONDS.observe(elapsed, "warmup")
+    logger.info("Process %d is ready in %.3fs", os.getpid(), elapsed)
+    try:
+        yield
+    finally:
+        if worker is not None:
+            await worker.stop()
+        await version_sync.stop()
+        await replicas.stop()
+        await hub.close()
+        shutdown_hashing()
+        await close_database()
 
 
 def create_app() -> FastAPI:
-    if not settings.PATH_FILES.is_dir():
-        settings.PATH_FILES.mkdir()
-    fastapi_app = FastAPI()
+    fastapi_app = FastAPI(lifespan=lifespan)
+    # Внутри CORS, чтобы браузер мог прочитать ответы 429 и 503.
+    fastapi_app.add_middleware(RateLimitMiddleware)
+    fastapi_app.add_middleware(AdmissionMiddleware)
     fastapi_app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -22,6 +74,7 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    fastapi_app.add_middleware(MetricsMiddleware)
     return fastapi_app
 
 
@@ -29,6 +82,7 @@ app = create_app()
 app.include_router(users_router, prefix="/api/v1", tags=["api/v1"])
 app.include_router(posts_router, prefix="/api/v1", tags=["api/v1"])
 app.include_router(files_router, prefix="/api/v1", tags=["api/v1"])
+app.include_router(search_router, prefix="/api/v1", tags=["api/v1"])
 
 
 @app.get("/")
@@ -41,3 +95,30 @@ def read_root() -> dict[str, str]:
 
     """
     return {"Hello": "World"}
+
+
+@app.get("/api/v1/cache/")
+def read_cache_stats() -> dict[str, dict[str, int]]:
+    """Статистика попаданий в кэши процесса.
+
+    Returns
+    -------
+        dict[str, dict[str, int]]: попадания и промахи по каждому кэшу.
+
+    """
+    return {cache.name: cache.stats() for cache in caches}
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics() -> PlainTextResponse:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Под gunicorn отвечает один из процессов, и метрики только его.
+
+    Returns
+    -------
+        PlainTextResponse: гистограммы задержек, SQL и пула соединений.
+
+    """
+    return PlainTextResponse(render_metrics(),
+                             media_type="text/plain; version=0.0.4")
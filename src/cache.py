@@ -0,0 +1,178 @@
+"""Кэши с ограничением времени жизни и количества записей."""
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+
+from metrics import CACHE_REQUESTS
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(Protocol):
+    """Хранилище записей кэша."""
+
+    async def get(self, key: str) -> Any | None: ...
+
+    async def get_many(self, keys: list[str]) -> list[Any | None]: ...
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    async def set_many(self, items: dict[str, Any], ttl: float) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    def discard(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    """Хранилище в памяти процесса с вытеснением давно не читанных записей."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Any | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[Any | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, items: dict[str, Any], ttl: float) -> None:
+        expires_at = time.monotonic() + ttl
+        for key, value in items.items():
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self.discard(key)
+
+    def discard(self, key: str) -> None:
+        self._items.pop(key, None)
+
+
+class RedisBackend:
+    """Общее для нескольких процессов хранилище в Redis."""
+
+    def __init__(self, url: str, prefix: str) -> None:
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "Install the 'redis' package to use CACHE_URL") from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        # Цикл событий хранит на задачи только слабые ссылки, и удаление
+        # без ссылки может собрать сборщик мусора до завершения.
+        self._deletes: set[asyncio.Task] = set()
+
+    async def get(self, key: str) -> Any | None:
+        value = await self._redis.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    async def get_many(self, keys: list[str]) -> list[Any | None]:
+        if not keys:
+            return []
+        values = await self._redis.mget([self.prefix + key for key in keys])
+        return [None if value is None else pickle.loads(value)
+                for value in values]
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self._redis.set(self.prefix + key, pickle.dumps(value),
+                              px=int(ttl * 1000))
+
+    async def set_many(self, items: dict[str, Any], ttl: float) -> None:
+        async with self._redis.pipeline(transaction=False) as pipeline:
+            for key, value in items.items():
+                pipeline.set(self.prefix + key, pickle.dumps(value),
+                             px=int(ttl * 1000))
+            await pipeline.execute()
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    def discard(self, key: str) -> None:
+        task = asyncio.get_running_loop().create_task(self.delete(key))
+        self._deletes.add(task)
+        task.add_done_callback(self._deleted)
+
+    def _deleted(self, task: asyncio.Task) -> None:
+        self._deletes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Cache delete failed: %r", task.exception())
+
+
+class Cache:
+    """Именованный кэш со счётчиками попаданий и промахов."""
+
+    def __init__(self, name: str, max_size: int, ttl: float,
+                 shared: bool = True) -> None:
+        self.name = name
+        self.ttl = ttl
+        if shared and settings.CACHE_URL:
+            self.backend: CacheBackend = RedisBackend(settings.CACHE_URL,
+                                                      f"{name}:")
+        else:
+            self.backend = MemoryBackend(max_size)
+        self.hits = 0
+        self.misses = 0
+        caches.append(self)
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(1, self.name, "miss")
+        else:
+            self.hits += 1
+            CACHE_REQUESTS.inc(1, self.name, "hit")
+        return value
+
+    async def get_many(self, keys: list[str]) -> dict[str, Any]:
+        """Найденные записи; отсутствующих ключей в ответе нет."""
+        found = {key: value for key, value in zip(
+            keys, await self.backend.get_many(keys)) if value is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        CACHE_REQUESTS.inc(len(found), self.name, "hit")
+        CACHE_REQUESTS.inc(len(keys) - len(found), self.name, "miss")
+        return found
+
+    async def set(self, key: str, value: Any,
+                  ttl: float | None = None) -> None:
+        await self.backend.set(key, value, self.ttl if ttl is None else ttl)
+
+    async def set_many(self, items: dict[str, Any],
+                       ttl: float | None = None) -> None:
+        if items:
+            await self.backend.set_many(items,
+                                        self.ttl if ttl is None else ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.backend.delete(key)
+
+    def discard(self, key: str) -> None:
+        """Удалить запись, не дожидаясь ответа хранилища."""
+        self.backend.discard(key)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+caches: list[Cache] = []
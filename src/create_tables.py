@@ -1,6 +1,33 @@
-from database import Base, engine, session_factory
-import app
+"""Приведение схемы базы данных к последней миграции.
 
-with session_factory() as session:
-    Base.metadata.create_all(bind=engine)
-    session.commit()
+Базы, созданные до появления миграций через metadata.create_all,
+помечаются начальной ревизией, после чего применяются остальные.
+"""
+import asyncio
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from database import close_database, get_engine
+
+INITIAL_REVISION = "0001"
+
+
+async def is_unversioned() -> bool:
+    """Проверка, что схема есть, но alembic о ней ещё не знает."""
+    async with get_engine().connect() as conn:
+        tables = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_table_names())
+    await close_database()
+    return "users" in tables and "alembic_version" not in tables
+
+
+def main() -> None:
+    config = Config("alembic.ini")
+    if asyncio.run(is_unversioned()):
+        command.stamp(config, INITIAL_REVISION)
+    command.upgrade(config, "head")
+
+
+main()
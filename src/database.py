@@ -1,15 +1,244 @@
-"""Файл для описания объекта sqlalchemy базы данных."""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+"""Файл для описания объекта sqlalchemy базы данных.
 
+Запись и чтение, которому нужны самые свежие данные, идут в основную
+базу через ``SessionDep``. Остальное чтение (``ReadSessionDep``) может
+уйти на реплику из ``DB_REPLICA_URLS``: фоновая проверка раз в
+``DB_REPLICA_CHECK_INTERVAL`` секунд измеряет отставание каждой реплики,
+запрос получает наименее занятую из тех, что отстают не больше чем на
+``DB_REPLICA_MAX_LAG``, а если таких нет, читает основную базу.
+Пользователь, который только что что-то записал, какое-то время читает
+основную базу, чтобы сразу видеть свои изменения. О записи знают
+только процессы с общим кэшем (``CACHE_URL``); без него следующий
+запрос, попавший в другой процесс или на другой узел, может прочитать
+реплику без этой записи.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import AsyncExitStack, suppress
+from typing import Annotated
+
+from fastapi import Depends
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, \
+    async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from cache import Cache
+from metrics import DB_READS, instrument_engine, observe_pool_wait
 from settings import settings
 
-engine = create_engine(f"{settings.DB_DIALECT}://"
-                       f"{settings.DB_USER}:{settings.DB_PASSWORD}@"
-                       f"{settings.DB_HOST}:{settings.DB_PORT}/"
-                       f"{settings.DB_NAME}", echo=True)
+logger = logging.getLogger(__name__)
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий ожидание свободного соединения."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Начало ожидания каждого запроса в порядке очереди.
+        self._waiting: dict[object, float] = {}
+
+    def _do_get(self):
+        started = time.perf_counter()
+        waiter = object()
+        self._waiting[waiter] = started
+        try:
+            return super()._do_get()
+        finally:
+            del self._waiting[waiter]
+            observe_pool_wait(time.perf_counter() - started)
+
+    def queue_delay(self) -> float:
+        """Сколько уже ждёт соединения самый давний запрос в очереди."""
+        for started in self._waiting.values():
+            return time.perf_counter() - started
+        return 0.0
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(url,
+                                 echo=settings.DB_ECHO,
+                                 poolclass=TimedPool,
+                                 pool_size=settings.DB_POOL_SIZE,
+                                 max_overflow=settings.DB_MAX_OVERFLOW,
+                                 pool_timeout=settings.DB_POOL_TIMEOUT,
+                                 pool_pre_ping=settings.DB_POOL_PRE_PING,
+                                 pool_recycle=settings.DB_POOL_RECYCLE)
+    instrument_engine(engine)
+    return engine
+
+
+DATABASE_URL = (f"{settings.DB_DIALECT}://"
+                f"{settings.DB_USER}:{settings.DB_PASSWORD}@"
+                f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}")
+
+# Движок основной базы создаётся при запуске приложения (или при первом
+# обращении в скриптах) и закрывается при остановке, так что следующий
+# запуск в том же процессе открывает новый.
+_engine: AsyncEngine | None = None
+_sessions = async_sessionmaker(expire_on_commit=False)
+
+
+def get_engine() -> AsyncEngine:
+    """Движок основной базы; создаёт его, если он ещё не открыт."""
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(DATABASE_URL)
+        _sessions.configure(bind=_engine)
+    return _engine
+
+
+def session_factory() -> AsyncSession:
+    """Новая сессия основной базы."""
+    get_engine()
+    return _sessions()
+
+
+async def close_database() -> None:
+    """Закрыть соединения основной базы и забыть движок."""
+    global _engine
+    if _engine is not None:
+        engine, _engine = _engine, None
+        await engine.dispose()
+
+# На основной базе отставание нулевое: так реплику можно временно
+# направить на основную базу.
+_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE coalesce(extract(epoch FROM now() "
+    "- pg_last_xact_replay_timestamp()), 'Infinity') END")
+
+
+class Replica:
+    """Реплика для чтения и её состояние по последней проверке."""
+
+    def __init__(self, url: str) -> None:
+        self.engine = _create_engine(url)
+        self.session_factory = async_sessionmaker(bind=self.engine,
+                                                  expire_on_commit=False)
+        self.name = self.engine.url.render_as_string()
+        self.lag = float("inf")
+        event.listen(self.engine.sync_engine, "handle_error",
+                     self._handle_error)
+
+    @property
+    def healthy(self) -> bool:
+        return self.lag <= settings.DB_REPLICA_MAX_LAG
+
+    @property
+    def load(self) -> int:
+        return self.engine.pool.checkedout()
+
+    def _handle_error(self, context) -> None:
+        # Не ждать следующей проверки, чтобы увести с реплики запросы.
+        if context.is_disconnect:
+            self.lag = float("inf")
+
+    async def check(self) -> None:
+        try:
+            async with asyncio.timeout(settings.DB_REPLICA_CHECK_INTERVAL):
+                async with self.engine.connect() as connection:
+                    self.lag = float(await connection.scalar(_LAG_QUERY))
+        except Exception as e:
+            if self.healthy:
+                logger.warning("Replica %s is unavailable: %r", self.name,
+                               e)
+            self.lag = float("inf")
+
+
+class ReplicaSet:
+    """Выбор базы для чтения."""
+
+    def __init__(self, urls: list[str]) -> None:
+        self.urls = urls
+        # Движки реплик создаются в start() и закрываются в stop().
+        self.replicas: list[Replica] = []
+        # Записи живут дольше допустимого отставания вместе с промежутком
+        # между проверками: за это время запись дойдёт до любой реплики,
+        # на которую могут направить чтение.
+        self._writers = Cache(
+            "recent_writers", settings.USER_CACHE_SIZE,
+            settings.DB_REPLICA_MAX_LAG + settings.DB_REPLICA_CHECK_INTERVAL)
+        self._task: asyncio.Task | None = None
+
+    async def mark_written(self, user_key: str) -> None:
+        """Читать основную базу, пока запись не дошла до реплик."""
+        if self.urls:
+            await self._writers.set(user_key, True)
+
+    async def session_factory(
+            self, user_key: str | None = None
+    ) -> Callable[[], AsyncSession]:
+        if not self.replicas:
+            return session_factory
+        if user_key is not None and await self._writers.get(user_key):
+            DB_READS.inc(1, "primary_sticky")
+            return session_factory
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            DB_READS.inc(1, "primary_fallback")
+            return session_factory
+        # Случайный порядок разбивает ничьи между одинаково занятыми.
+        random.shuffle(healthy)
+        DB_READS.inc(1, "replica")
+        return min(healthy, key=lambda replica: replica.load).session_factory
+
+    async def start(self) -> None:
+        self.replicas = [Replica(url) for url in self.urls]
+        if self.replicas:
+            await self._check()
+            self._task = asyncio.create_task(self._check_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        stopped, self.replicas = self.replicas, []
+        for replica in stopped:
+            await replica.engine.dispose()
+
+    async def _check(self) -> None:
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    async def _check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL)
+            await self._check()
+
+
+replicas = ReplicaSet(settings.DB_REPLICA_URLS)
+
+
+async def warm_up_pool() -> None:
+    """Заранее открыть постоянные соединения пула основной базы."""
+    engine = get_engine()
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(*(stack.enter_async_context(engine.connect())
+                               for _ in range(settings.DB_POOL_SIZE)))
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """Сессия базы данных на время одного запроса."""
+    async with session_factory() as session:
+        yield session
+
+
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    """Сессия только для чтения, возможно, на реплике."""
+    async with (await replicas.session_factory())() as session:
+        yield session
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
 
-session_factory = sessionmaker(bind=engine)
 
 class Base(DeclarativeBase):
     """Базовая модель."""
@@ -0,0 +1,260 @@
+"""Рассылка событий в реальном времени подключённым клиентам.
+
+События публикуются в темы (``author:{id}``, ``post:{id}``,
+``user:{id}``). У каждого подключения своя ограниченная очередь: если
+клиент не успевает её разбирать, подключение закрывается, а клиент
+переподключается и перечитывает данные. Бэкенд ``postgres`` доставляет
+события во все процессы приложения через LISTEN/NOTIFY.
+
+Соединение для LISTEN проверяется раз в ``EVENTS_PING_INTERVAL`` секунд,
+а разорванное соединение открывается заново с растущей от
+``EVENTS_RECONNECT_DELAY`` до ``EVENTS_RECONNECT_MAX_DELAY`` паузой
+между попытками. События, отправленные за время разрыва, потеряны,
+поэтому после восстановления все подписки процесса закрываются так же,
+как у медленного клиента.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import suppress
+from typing import Any, Protocol
+
+from metrics import EVENTS_DELIVERED, EVENTS_PUBLISHED, \
+    EVENTS_SLOW_CONSUMERS
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+Event = dict[str, Any]
+
+# NOTIFY принимает полезную нагрузку не длиннее 8000 байт.
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class Subscription:
+    """Очередь событий одного подключения."""
+
+    def __init__(self, hub: "Hub", max_size: int) -> None:
+        self.hub = hub
+        self.topics: set[str] = set()
+        self.queue: asyncio.Queue[Event | None] = asyncio.Queue(max_size)
+        self.overflowed = False
+
+    def push(self, event: Event) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленного клиента отключаем, а не копим события в памяти.
+            EVENTS_SLOW_CONSUMERS.inc()
+            self.drop()
+        else:
+            EVENTS_DELIVERED.inc()
+
+    def drop(self) -> None:
+        """Прекратить доставку: подписчик пропустил события."""
+        if self.overflowed:
+            return
+        self.overflowed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self) -> Event | None:
+        """Следующее событие или None, если события пропущены."""
+        return await self.queue.get()
+
+    def subscribe(self, *topics: str) -> None:
+        self.hub.add_topics(self, topics)
+
+    def unsubscribe(self, *topics: str) -> None:
+        self.hub.remove_topics(self, topics)
+
+    def close(self) -> None:
+        self.hub.remove_topics(self, tuple(self.topics))
+
+
+class EventsBackend(Protocol):
+    """Транспорт событий между процессами."""
+
+    async def publish(self, topic: str, event: Event) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class MemoryBackend:
+    """Доставка в пределах одного процесса."""
+
+    def __init__(self, hub: "Hub") -> None:
+        self.hub = hub
+
+    async def publish(self, topic: str, event: Event) -> None:
+        self.hub.deliver(topic, event)
+
+    async def close(self) -> None:
+        pass
+
+
+class PostgresBackend:
+    """Доставка во все процессы через LISTEN/NOTIFY."""
+
+    def __init__(self, hub: "Hub", channel: str) -> None:
+        self.hub = hub
+        self.channel = channel
+        self._connection = None
+        self._lock = asyncio.Lock()
+        self._lost = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def _connect(self):
+        import asyncpg
+
+        from sqlalchemy.engine import make_url
+
+        from database import DATABASE_URL
+
+        if self._connection is None or self._connection.is_closed():
+            lost = self._connection is not None
+            url = make_url(DATABASE_URL).set(drivername="postgresql")
+            connection = await asyncpg.connect(
+                url.render_as_string(hide_password=False))
+            try:
+                await connection.add_listener(self.channel, self._notify)
+            except BaseException:
+                connection.terminate()
+                raise
+            connection.add_termination_listener(self._terminated)
+            self._connection = connection
+            if lost:
+                logger.warning("Listening to %s again, events sent in "
+                               "between are lost", self.channel)
+                self.hub.drop_subscriptions()
+        return self._connection
+
+    def _notify(self, connection, pid, channel, payload: str) -> None:
+        message = json.loads(payload)
+        self.hub.deliver(message["topic"], message["event"])
+
+    def _terminated(self, connection) -> None:
+        if connection is self._connection:
+            self._lost.set()
+
+    async def _check(self) -> None:
+        connection = await self._connect()
+        try:
+            async with asyncio.timeout(settings.EVENTS_PING_INTERVAL):
+                await connection.execute("SELECT 1")
+        except BaseException:
+            # Молча оборванное соединение иначе слушало бы впустую.
+            connection.terminate()
+            raise
+
+    async def _watch(self) -> None:
+        delay = settings.EVENTS_RECONNECT_DELAY
+        while True:
+            self._lost.clear()
+            try:
+                async with self._lock:
+                    await self._check()
+            except Exception as e:
+                if delay == settings.EVENTS_RECONNECT_DELAY:
+                    logger.warning("Lost connection listening to %s: %r",
+                                   self.channel, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.EVENTS_RECONNECT_MAX_DELAY)
+                continue
+            delay = settings.EVENTS_RECONNECT_DELAY
+            with suppress(TimeoutError):
+                async with asyncio.timeout(settings.EVENTS_PING_INTERVAL):
+                    await self._lost.wait()
+
+    async def start(self) -> None:
+        async with self._lock:
+            await self._connect()
+            if self._task is None:
+                self._task = asyncio.create_task(self._watch())
+
+    async def publish(self, topic: str, event: Event) -> None:
+        payload = json.dumps({"topic": topic, "event": event}, default=str)
+        if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            # Без содержимого: клиент дочитает его обычным запросом.
+            event = {key: value for key, value in event.items()
+                     if isinstance(value, int | bool) or key == "type"}
+            event["truncated"] = True
+            payload = json.dumps({"topic": topic, "event": event})
+        async with self._lock:
+            connection = await self._connect()
+            await connection.execute("SELECT pg_notify($1, $2)",
+                                     self.channel, payload)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        async with self._lock:
+            if self._connection is not None:
+                await self._connection.close()
+                self._connection = None
+
+
+class Hub:
+    """Реестр подписок процесса и точка публикации событий."""
+
+    def __init__(self, backend: str = settings.EVENTS_BACKEND) -> None:
+        self._topics: defaultdict[str, set[Subscription]] = \
+            defaultdict(set)
+        if backend == "postgres":
+            self.backend = PostgresBackend(self, settings.EVENTS_CHANNEL)
+        else:
+            self.backend = MemoryBackend(self)
+
+    async def connect(self) -> Subscription:
+        """Новое подключение; для postgres заодно начинаем слушать канал."""
+        if isinstance(self.backend, PostgresBackend):
+            await self.backend.start()
+        return Subscription(self, settings.EVENTS_QUEUE_SIZE)
+
+    def add_topics(self, subscription: Subscription,
+                   topics: tuple[str, ...]) -> None:
+        for topic in topics:
+            subscription.topics.add(topic)
+            self._topics[topic].add(subscription)
+
+    def remove_topics(self, subscription: Subscription,
+                      topics: tuple[str, ...]) -> None:
+        for topic in topics:
+            subscription.topics.discard(topic)
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def drop_subscriptions(self) -> None:
+        """Закрыть все подписки процесса, пропустившие события."""
+        for subscription in {subscription
+                             for subscribers in self._topics.values()
+                             for subscription in subscribers}:
+            subscription.drop()
+
+    def deliver(self, topic: str, event: Event) -> None:
+        for subscription in tuple(self._topics.get(topic, ())):
+            subscription.push(event)
+
+    async def publish(self, topic: str, event: Event) -> None:
+        """Публикация события; ошибки доставки не ломают запрос."""
+        EVENTS_PUBLISHED.inc(1, event["type"])
+        try:
+            await self.backend.publish(topic, event)
+        except Exception:
+            logger.exception("Failed to publish event to %s", topic)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+hub = Hub()
@@ -0,0 +1,155 @@
+"""Хранилища содержимого медиафайлов.
+
+Ключи имеют вид ``ab/cd/<sha256>``: первые байты хэша задают вложенные
+каталоги, поэтому ни в одном каталоге не оказывается миллионов файлов.
+"""
+import os
+from pathlib import Path
+from typing import Protocol
+
+from starlette.concurrency import run_in_threadpool
+
+from settings import settings
+
+
+def shard(name: str) -> str:
+    return f"{name[:2]}/{name[2:4]}/{name}"
+
+
+class StorageBackend(Protocol):
+    """Хранилище неизменяемых объектов по ключу."""
+
+    async def save(self, key: str, source: Path,
+                   media_type: str | None = None) -> None:
+        """Переместить локальный файл в хранилище под ключом."""
+
+    async def exists(self, key: str) -> bool: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def fetch(self, key: str, target: Path) -> None:
+        """Скачать объект в локальный файл."""
+
+    def path(self, key: str) -> Path | None:
+        """Локальный путь объекта или None, если хранилище удалённое."""
+
+    def url(self, key: str) -> str:
+        """Адрес, по которому клиент может скачать объект сам."""
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LocalBackend:
+    """Каталог на диске, общий для процессов одного узла."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _save(self, key: str, source: Path) -> None:
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, target)
+        _fsync_dir(target.parent)
+
+    async def save(self, key: str, source: Path,
+                   media_type: str | None = None) -> None:
+        await run_in_threadpool(self._save, key, source)
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool((self.root / key).is_file)
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool((self.root / key).unlink, True)
+
+    async def fetch(self, key: str, target: Path) -> None:
+        raise RuntimeError("Local objects are read in place")
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def url(self, key: str) -> str:
+        raise RuntimeError("Local objects are served by the application")
+
+
+class S3Backend:
+    """Бакет S3-совместимого хранилища, общий для всех реплик."""
+
+    def __init__(self, bucket: str, endpoint_url: str | None = None,
+                 region: str | None = None, public_url: str | None = None,
+                 url_ttl: int = 3600) -> None:
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError(
+                "Install the 'boto3' package to use MEDIA_STORAGE=s3") from e
+        self.bucket = bucket
+        self.public_url = public_url
+        self.url_ttl = url_ttl
+        self._client_error = ClientError
+        # Клиент boto3 потокобезопасен, поэтому один на весь процесс.
+        self._client = boto3.client("s3", endpoint_url=endpoint_url,
+                                    region_name=region)
+
+    async def save(self, key: str, source: Path,
+                   media_type: str | None = None) -> None:
+        extra = {"CacheControl": (f"public, max-age="
+                                  f"{settings.MEDIA_CACHE_MAX_AGE}, "
+                                  "immutable")}
+        if media_type:
+            extra["ContentType"] = media_type
+        await run_in_threadpool(self._client.upload_file, str(source),
+                                self.bucket, key, ExtraArgs=extra)
+        await run_in_threadpool(source.unlink, True)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(self._client.head_object,
+                                    Bucket=self.bucket, Key=key)
+        except self._client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self._client.delete_object,
+                                Bucket=self.bucket, Key=key)
+
+    async def fetch(self, key: str, target: Path) -> None:
+        await run_in_threadpool(self._client.download_file, self.bucket,
+                                key, str(target))
+
+    def path(self, key: str) -> None:
+        return None
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return self._client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.url_ttl)
+
+
+def create_backend() -> StorageBackend:
+    if settings.MEDIA_STORAGE == "s3":
+        if not settings.MEDIA_S3_BUCKET:
+            raise RuntimeError("MEDIA_S3_BUCKET is required for s3 storage")
+        return S3Backend(settings.MEDIA_S3_BUCKET,
+                         endpoint_url=settings.MEDIA_S3_ENDPOINT_URL,
+                         region=settings.MEDIA_S3_REGION,
+                         public_url=settings.MEDIA_S3_PUBLIC_URL,
+                         url_ttl=settings.MEDIA_S3_URL_TTL)
+    if settings.MEDIA_STORAGE != "local":
+        raise RuntimeError(
+            f"Unknown MEDIA_STORAGE {settings.MEDIA_STORAGE!r}")
+    return LocalBackend(settings.PATH_FILES)
+
+
+storage = create_backend()
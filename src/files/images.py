@@ -0,0 +1,122 @@
+"""Уменьшенные копии изображений для ленты."""
+import uuid
+from pathlib import Path
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
+
+from files.backends import shard, storage
+from files.models import FileModel
+from files.storage import file_key
+from settings import settings
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tiff"}
+
+
+def is_image(extension: str) -> bool:
+    return extension.lower() in IMAGE_EXTENSIONS
+
+
+def variant_key(file_model: FileModel, size: str) -> str:
+    ext = settings.IMAGE_VARIANT_FORMAT
+    if file_model.digest is None:
+        return f"variants/{file_model.uuid}_{size}.{ext}"
+    return f"variants/{shard(file_model.digest)}_{size}.{ext}"
+
+
+def variant_urls(file_model: FileModel) -> dict[str, str]:
+    """Адреса оригинала и всех уменьшенных копий файла."""
+    url = f"/api/v1/media_files/{file_model.get_filename()}"
+    urls = {"original": url}
+    if is_image(file_model.extension):
+        for size in settings.IMAGE_SIZES:
+            urls[size] = f"{url}?size={size}"
+    return urls
+
+
+def _to_8bit(image: Image.Image) -> Image.Image:
+    # Целые 16 и 32 бита и float ни thumbnail, ни WebP не принимают:
+    # диапазон значений растягивается на оттенки серого.
+    if image.mode != "F":
+        image = image.convert("I")
+    low, high = image.getextrema()
+    scale = 255 / (high - low) if high > low else 0
+    return image.point(lambda value: (value - low) * scale).convert("L")
+
+
+def render_variant(source: Path, target: Path, max_side: int) -> None:
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode.startswith(("I", "F")):
+            image = _to_8bit(image)
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        image.thumbnail((max_side, max_side))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(target, format=settings.IMAGE_VARIANT_FORMAT,
+                   quality=settings.IMAGE_VARIANT_QUALITY)
+
+
+async def _mark_unrenderable(session, file_model: FileModel) -> None:
+    same_content = (FileModel.uuid == file_model.uuid
+                    if file_model.digest is None
+                    else FileModel.digest == file_model.digest)
+    await session.execute(update(FileModel).where(same_content).values(
+        unrenderable=True))
+    await session.commit()
+    # Без отметки объекта в его сессии: он может быть из сессии реплики.
+    set_committed_value(file_model, "unrenderable", True)
+
+
+async def ensure_variant(session, file_model: FileModel,
+                         size: str) -> str | None:
+    """Вернуть ключ уменьшенной копии, создав её при первом запросе.
+
+    Returns
+    -------
+        str | None: ключ копии или None, если файл не изображение или
+        копию из него не сделать.
+
+    """
+    key = variant_key(file_model, size)
+    if size in file_model.sizes:
+        return key
+    if file_model.unrenderable or not is_image(file_model.extension):
+        return None
+    if await storage.exists(key):
+        return key
+    source = storage.path(file_key(file_model))
+    download = None
+    target = settings.PATH_FILES / f".{uuid.uuid4()}.tmp"
+    try:
+        if source is None:
+            download = settings.PATH_FILES / f".{uuid.uuid4()}.tmp"
+            await storage.fetch(file_key(file_model), download)
+            source = download
+        try:
+            await run_in_threadpool(render_variant, source, target,
+                                    settings.IMAGE_SIZES[size])
+        except (UnidentifiedImageError, Image.DecompressionBombError,
+                OSError, ValueError):
+            # Копию не сделать: отдаётся оригинал, и больше его не
+            # скачиваем и не разбираем.
+            await _mark_unrenderable(session, file_model)
+            return None
+        await storage.save(key, target,
+                           f"image/{settings.IMAGE_VARIANT_FORMAT}")
+    except OSError:
+        # Копия не сохранилась: пока отдаётся оригинал.
+        return None
+    finally:
+        await run_in_threadpool(target.unlink, True)
+        if download is not None:
+            await run_in_threadpool(download.unlink, True)
+    await session.execute(update(FileModel).where(
+        FileModel.uuid == file_model.uuid,
+        ~FileModel.sizes.any(size)).values(
+        sizes=FileModel.sizes + [size]))
+    await session.commit()
+    return key
@@ -1,12 +1,21 @@
 from uuid import UUID
 
-from sqlalchemy import ForeignKey, text
+from sqlalchemy import BigInteger, ForeignKey, String, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.types import Uuid
 
 from database import Base
 
 
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger)
+    ref_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+
 class FileModel(Base):
     __tablename__ = "media_files"
 
@@ -14,8 +23,15 @@ class FileModel(Base):
                                        server_default=text(
                                            "gen_random_uuid()"))
     extension: Mapped[str]
-    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"))
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"), index=True)
+    digest: Mapped[str | None] = mapped_column(ForeignKey("blobs.digest"),
+                                               index=True)
+    sizes: Mapped[list[str]] = mapped_column(ARRAY(String), default=list,
+                                             server_default="{}")
+    # Оригинал не удалось разобрать: копии не делаются, отдаётся он сам.
+    unrenderable: Mapped[bool] = mapped_column(default=False,
+                                               server_default="false")
     post: Mapped["Post"] = relationship("Post", back_populates="images")
 
     def get_filename(self) -> str:
-        return f"{self.uuid}.{self.extension}"
+        return f"{self.digest or self.uuid}.{self.extension}"
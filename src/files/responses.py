@@ -0,0 +1,102 @@
+"""Ответы с медиафайлами с поддержкой кэширования и диапазонов."""
+import mimetypes
+import os
+import re
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from settings import settings
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def _etag(name: str, stat: os.stat_result) -> str:
+    return f'"{name}-{stat.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag
+               for tag in header.split(","))
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    match = _RANGE_RE.fullmatch(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        return max(size - int(end), 0), size - 1
+    end = min(int(end), size - 1) if end else size - 1
+    return int(start), end
+
+
+async def _read_range(path: Path, start: int,
+                      end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(settings.UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def media_response(request: Request, path: Path,
+                         name: str | None = None) -> Response:
+    """Отдать неизменяемый файл с ETag, 304 и частичными ответами.
+
+    Содержимое хранится без расширения, поэтому тип определяется по name.
+    """
+    name = name or path.name
+    try:
+        stat = await anyio.Path(path).stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404,
+                            detail=f"File {name} is not found")
+    etag = _etag(name, stat)
+    headers = {
+        "etag": etag,
+        "cache-control": (f"public, max-age={settings.MEDIA_CACHE_MAX_AGE},"
+                          " immutable"),
+        "accept-ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(name)[0] \
+        or "application/octet-stream"
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        relative = path.relative_to(settings.PATH_FILES).as_posix()
+        headers["x-accel-redirect"] = (settings.MEDIA_ACCEL_REDIRECT_PREFIX
+                                       + relative)
+        return Response(headers=headers, media_type=media_type)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is not None:
+            start, end = byte_range
+            if start > end or start >= stat.st_size:
+                return Response(
+                    status_code=416,
+                    headers={"content-range": f"bytes */{stat.st_size}"})
+            headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+            headers["content-length"] = str(end - start + 1)
+            return StreamingResponse(_read_range(path, start, end),
+                                     status_code=206, headers=headers,
+                                     media_type=media_type)
+
+    return FileResponse(path=path, filename=name, headers=headers,
+                        media_type=media_type, stat_result=stat)
@@ -1,21 +1,78 @@
-from fastapi import HTTPException
-from starlette.responses import FileResponse
+import re
+from uuid import UUID
 
-from database import session_factory
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from starlette.responses import RedirectResponse, Response
+
+from database import ReadSessionDep, replicas, session_factory
+from files.backends import storage
+from files.images import ensure_variant, variant_key
 from files.models import FileModel
+from files.responses import media_response
+from files.storage import file_key
 from settings import settings
 
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def _parse_filename(filename: str) -> FileModel:
+    try:
+        name, ext = filename.rsplit(".", 1)
+        if _DIGEST_RE.fullmatch(name):
+            return FileModel(digest=name, extension=ext)
+        return FileModel(uuid=UUID(name), extension=ext)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Bad filename")
+
+
+async def _find_file(session, known: FileModel) -> FileModel | None:
+    if known.digest is None:
+        file_model = await session.get(FileModel, known.uuid)
+    else:
+        file_model = await session.scalar(select(FileModel).where(
+            FileModel.digest == known.digest,
+            FileModel.extension == known.extension).limit(1))
+    if file_model is None or file_model.extension != known.extension:
+        return None
+    return file_model
+
+
+async def _serve(request: Request, key: str,
+                 name: str | None = None) -> Response:
+    path = storage.path(key)
+    if path is None:
+        return RedirectResponse(storage.url(key), status_code=307)
+    return await media_response(request, path,
+                                name or key.rsplit("/", 1)[-1])
+
 
-def get_file(filename: str) -> FileResponse:
-    with session_factory() as session:
-        try:
-            file_uuid, ext = filename.rsplit(".", 1)
-            file_model = session.query(FileModel).filter(
-                FileModel.uuid == file_uuid).first()
-            if not file_model or file_model.extension != ext:
-                raise HTTPException(status_code=404,
-                                    detail=f"File {file_uuid} is not found")
-            return FileResponse(path=settings.PATH_FILES / filename,
-                                filename=filename)
-        except ValueError:
-            raise HTTPException(status_code=404, detail="Bad filename")
+async def get_file(request: Request, filename: str,
+                   session: ReadSessionDep,
+                   size: str | None = None) -> Response:
+    if size is not None and size not in settings.IMAGE_SIZES:
+        raise HTTPException(status_code=404, detail=f"Unknown size {size}")
+    known = _parse_filename(filename)
+    if settings.MEDIA_SKIP_DB_LOOKUP:
+        key = (file_key(known) if size is None
+               else variant_key(known, size))
+        if await storage.exists(key):
+            return await _serve(request, key,
+                                filename if size is None else None)
+    file_model = await _find_file(session, known)
+    if file_model is None and replicas.replicas:
+        # Только что загруженный файл мог ещё не дойти до реплики.
+        async with session_factory() as primary:
+            file_model = await _find_file(primary, known)
+    if file_model is None:
+        raise HTTPException(status_code=404,
+                            detail=f"File {filename} is not found")
+    if size is not None:
+        # Сессия не берёт соединение, пока копия уже есть и писать
+        # отметку о ней не нужно.
+        async with session_factory() as primary:
+            key = await ensure_variant(primary, file_model, size)
+        if key is not None:
+            return await _serve(request, key)
+    return await _serve(request, file_key(file_model),
+                        file_model.get_filename())
@@ -0,0 +1,158 @@
+"""Потоковое сохранение загружаемых файлов с дедупликацией по хэшу."""
+import hashlib
+import mimetypes
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+
+from files.backends import shard, storage
+from files.models import Blob, FileModel
+from metrics import UPLOAD_BYTES
+from settings import settings
+
+
+def blob_key(digest: str) -> str:
+    return shard(digest)
+
+
+def file_key(file_model: FileModel) -> str:
+    """Ключ содержимого файла в хранилище.
+
+    Файлы, загруженные до появления хэшей, лежат в корне под своим uuid.
+    """
+    if file_model.digest is None:
+        return f"{file_model.uuid}.{file_model.extension}"
+    return blob_key(file_model.digest)
+
+
+@dataclass
+class StagedFile:
+    """Файл, записанный во временный путь, но ещё не опубликованный."""
+
+    uuid: uuid.UUID
+    extension: str
+    tmp_path: Path
+    size: int
+    digest: str = ""
+    is_new: bool = False
+
+    @property
+    def key(self) -> str:
+        return blob_key(self.digest)
+
+
+def _write(f: BinaryIO, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def _finish(f: BinaryIO) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+async def stage_upload(file: UploadFile, max_size: int) -> StagedFile:
+    """Записать загрузку во временный файл кусками вне цикла событий.
+
+    Хэш SHA-256 считается по ходу записи, второго чтения файла нет.
+    """
+    file_uuid = uuid.uuid4()
+    staged = StagedFile(uuid=file_uuid,
+                        extension=file.filename.split(".")[-1],
+                        tmp_path=settings.PATH_FILES / f".{file_uuid}.tmp",
+                        size=0)
+    hasher = hashlib.sha256()
+    f = await run_in_threadpool(staged.tmp_path.open, "wb")
+    try:
+        while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+            staged.size += len(chunk)
+            if staged.size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File {file.filename} is too large")
+            await run_in_threadpool(_write, f, hasher, chunk)
+        await run_in_threadpool(_finish, f)
+        UPLOAD_BYTES.inc(staged.size)
+    except BaseException:
+        f.close()
+        await run_in_threadpool(staged.tmp_path.unlink, True)
+        raise
+    staged.digest = hasher.hexdigest()
+    return staged
+
+
+async def acquire_blobs(session, staged: list[StagedFile]) -> None:
+    """Увеличить счётчики ссылок на содержимое загруженных файлов.
+
+    Строка blobs остаётся заблокированной до конца транзакции, поэтому
+    одновременная загрузка того же содержимого дождётся публикации.
+    Блокировки берутся в порядке хэшей, чтобы не было взаимоблокировок.
+    """
+    for file in sorted(staged, key=lambda file: file.digest):
+        ref_count = await session.scalar(
+            pg_insert(Blob).values(digest=file.digest, size=file.size,
+                                   ref_count=1)
+            .on_conflict_do_update(index_elements=[Blob.digest],
+                                   set_={"ref_count": Blob.ref_count + 1})
+            .returning(Blob.ref_count))
+        file.is_new = ref_count == 1
+
+
+async def publish_staged(staged: list[StagedFile]) -> None:
+    """Перенести новое содержимое в хранилище, дубликаты удалить."""
+    for file in staged:
+        if file.is_new:
+            media_type = mimetypes.guess_type(f"f.{file.extension}")[0]
+            await storage.save(file.key, file.tmp_path, media_type)
+        else:
+            await run_in_threadpool(file.tmp_path.unlink, True)
+
+
+async def discard_staged(staged: list[StagedFile]) -> None:
+    """Удалить временные файлы и содержимое, добавленное этой загрузкой."""
+    for file in staged:
+        await run_in_threadpool(file.tmp_path.unlink, True)
+        if file.is_new:
+            await storage.delete(file.key)
+
+
+async def release_files(session, files: list[FileModel]) -> None:
+    """Удалить файлы и уменьшить счётчики ссылок на их содержимое.
+
+    Содержимое, на которое больше никто не ссылается, удаляется из
+    хранилища вместе с уменьшенными копиями ещё до фиксации транзакции,
+    пока строки blobs заблокированы: одновременная загрузка того же
+    содержимого дождётся фиксации и сохранит его заново.
+    """
+    from files.images import variant_key
+
+    if not files:
+        return
+    await session.execute(delete(FileModel).where(
+        FileModel.uuid.in_([file.uuid for file in files])))
+    refs = Counter(file.digest for file in files if file.digest is not None)
+    released = set()
+    for digest in sorted(refs):
+        ref_count = await session.scalar(
+            update(Blob).where(Blob.digest == digest)
+            .values(ref_count=Blob.ref_count - refs[digest])
+            .returning(Blob.ref_count))
+        if ref_count is not None and ref_count <= 0:
+            await session.execute(delete(Blob).where(Blob.digest == digest))
+            released.add(digest)
+    for file in files:
+        # Файлы без хэша ни с кем не делят содержимое.
+        if file.digest is None or file.digest in released:
+            keys = [file_key(file), *(variant_key(file, size)
+                                      for size in settings.IMAGE_SIZES)]
+            for key in keys:
+                await storage.delete(key)
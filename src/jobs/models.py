@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import BigInteger, Index, String, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_pending_run_at", "run_at",
+              postgresql_where=text("status = 'pending'")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    kind: Mapped[str]
+    payload: Mapped[dict[str, Any]] = mapped_column(JSONB)
+    idempotency_key: Mapped[str | None] = mapped_column(unique=True)
+    status: Mapped[str] = mapped_column(String(16), default="pending",
+                                        server_default="pending")
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+    run_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    last_error: Mapped[str | None]
@@ -0,0 +1,184 @@
+"""Очередь фоновых задач в таблице Postgres.
+
+Задача ставится в той же транзакции, что и данные, которые она
+обрабатывает, поэтому не теряется и не запускается раньше их фиксации.
+Обработчики забирают задачи через ``FOR UPDATE SKIP LOCKED`` и сдвигают
+``run_at`` на время аренды: если процесс упал посреди задачи, её
+подхватит другой обработчик, когда аренда истечёт. Поэтому обработчики
+задач должны быть идемпотентными. Пропускная способность растёт
+добавлением процессов ``worker.py``.
+"""
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import session_factory
+from jobs.models import Job
+from metrics import JOB_DURATION, JOBS_PROCESSED
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any, dict[str, Any]], Awaitable[None]]
+
+CLEANUP_INTERVAL = 60
+
+
+@dataclass
+class JobType:
+    handler: Handler
+    on_failure: Handler | None = None
+
+
+job_types: dict[str, JobType] = {}
+
+
+def job_handler(kind: str, on_failure: Handler | None = None):
+    """Зарегистрировать обработчик задач вида kind.
+
+    on_failure вызывается один раз, когда попытки исчерпаны.
+    """
+    def register(handler: Handler) -> Handler:
+        job_types[kind] = JobType(handler, on_failure)
+        return handler
+    return register
+
+
+async def enqueue(session, kind: str, payload: dict[str, Any],
+                  idempotency_key: str | None = None) -> None:
+    """Поставить задачу в очередь в текущей транзакции.
+
+    Повторная постановка с тем же ключом ничего не делает.
+    """
+    await session.execute(pg_insert(Job).values(
+        kind=kind, payload=payload, idempotency_key=idempotency_key,
+    ).on_conflict_do_nothing(index_elements=[Job.idempotency_key]))
+
+
+async def _claim(session):
+    claimable = select(Job.id).where(
+        Job.status == "pending", Job.run_at <= func.now()).order_by(
+        Job.run_at).limit(1).with_for_update(skip_locked=True)
+    job = (await session.execute(update(Job).where(
+        Job.id == claimable.scalar_subquery()).values(
+        attempts=Job.attempts + 1,
+        run_at=func.now() + timedelta(seconds=settings.JOBS_LEASE),
+    ).returning(Job.id, Job.kind, Job.payload, Job.attempts))).first()
+    await session.commit()
+    return job
+
+
+class Worker:
+    """Несколько параллельных циклов, выполняющих задачи по одной."""
+
+    def __init__(self, concurrency: int = settings.JOBS_CONCURRENCY) -> None:
+        self.concurrency = concurrency
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def run(self) -> None:
+        await asyncio.gather(
+            *(self._loop() for _ in range(self.concurrency)),
+            self._cleanup_loop())
+
+    def request_stop(self) -> None:
+        self._stopping.set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Дождаться завершения начатых задач и остановиться."""
+        self.request_stop()
+        if self._task is not None:
+            await self._task
+
+    async def _sleep(self, seconds: float) -> None:
+        with suppress(TimeoutError):
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+
+    async def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                ran = await self.run_once()
+            except Exception:
+                logger.exception("Job queue is unavailable")
+                ran = False
+            if not ran:
+                await self._sleep(settings.JOBS_POLL_INTERVAL)
+
+    async def run_once(self) -> bool:
+        """Выполнить одну задачу, если она есть.
+
+        Returns
+        -------
+            bool: была ли задача в очереди.
+
+        """
+        async with session_factory() as session:
+            job = await _claim(session)
+            if job is None:
+                return False
+            job_type = job_types.get(job.kind)
+            started = time.perf_counter()
+            try:
+                if job_type is None:
+                    raise LookupError(f"Unknown job kind {job.kind!r}")
+                await job_type.handler(session, job.payload)
+                await session.execute(update(Job).where(
+                    Job.id == job.id).values(status="done",
+                                             last_error=None))
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                await self._fail(session, job, job_type, e)
+            else:
+                JOBS_PROCESSED.inc(1, job.kind, "done")
+            finally:
+                JOB_DURATION.observe(time.perf_counter() - started,
+                                     job.kind)
+        return True
+
+    async def _fail(self, session, job, job_type: JobType | None,
+                    error: Exception) -> None:
+        final = job_type is None or job.attempts >= settings.JOBS_MAX_ATTEMPTS
+        values: dict[str, Any] = {"last_error": repr(error)[:1000]}
+        if final:
+            values["status"] = "failed"
+        else:
+            # Экспоненциальная пауза между попытками.
+            values["run_at"] = func.now() + timedelta(
+                seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+        await session.execute(update(Job).where(Job.id == job.id).values(
+            values))
+        await session.commit()
+        JOBS_PROCESSED.inc(1, job.kind, "failed" if final else "retry")
+        logger.warning("Job %s (%s) attempt %s failed: %r", job.id,
+                       job.kind, job.attempts, error)
+        if final and job_type is not None and job_type.on_failure:
+            try:
+                await job_type.on_failure(session, job.payload)
+                await session.commit()
+            except Exception:
+                logger.exception("Failure handler of job %s failed", job.id)
+
+    async def _cleanup_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                async with session_factory() as session:
+                    await session.execute(delete(Job).where(
+                        Job.status == "done",
+                        Job.created_at < func.now() - timedelta(
+                            seconds=settings.JOBS_RETENTION)))
+                    await session.commit()
+            except Exception:
+                logger.exception("Could not remove finished jobs")
+            await self._sleep(CLEANUP_INTERVAL)
@@ -0,0 +1,271 @@
+"""Ограничение частоты запросов и защита от перегрузки.
+
+Частоту запросов одного клиента ограничивают корзины маркеров: у класса
+маршрутов из ``RATE_LIMITS`` своя корзина на каждого пользователя (или
+адрес, если запрос без токена) ёмкостью ``n`` маркеров, которая
+наполняется заново за ``period`` секунд. Запрос без маркера получает 429
+с ``Retry-After``. При заданном ``CACHE_URL`` корзины хранятся в Redis и
+общие для всех процессов, иначе у каждого процесса свои. Маршрут
+объявляет класс через ``rate_limit``, а проверяет его
+``RateLimitMiddleware`` ещё до чтения тела запроса, чтобы отклонённая
+загрузка не принималась целиком.
+
+Независимо от клиента процесс отклоняет новые запросы с 503, когда в
+работе уже ``ADMISSION_MAX_IN_FLIGHT`` запросов или когда самый давний
+запрос в очереди к пулу основной базы ждёт соединения дольше
+``ADMISSION_MAX_POOL_WAIT`` секунд: такой запрос всё равно не успеет
+выполниться быстро, а принятый лишь удлинит очередь остальным.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Protocol
+
+from fastapi import Depends, HTTPException, Request, status
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from database import get_engine
+from metrics import RATE_LIMITED, REQUESTS_SHED
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+KeyFunc = Callable[[Request], Awaitable[str]]
+
+# Без них не видно самой перегрузки.
+EXEMPT_PATHS = frozenset({"/", "/metrics"})
+
+
+class RateLimitBackend(Protocol):
+    """Хранилище корзин маркеров."""
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        """Взять маркер из корзины.
+
+        Returns
+        -------
+            float: 0, если маркер взят, иначе через сколько секунд он
+            появится.
+
+        """
+        ...
+
+
+class MemoryBackend:
+    """Корзины в памяти процесса; давно не нужные вытесняются."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        # Вытесненная корзина всё равно была бы уже полной.
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Время берётся у Redis, чтобы часы процессов не влияли на корзины.
+# Дробное число Redis вернул бы целым, поэтому ответ — строка.
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil((capacity - tokens) / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisBackend:
+    """Общие для нескольких процессов корзины в Redis."""
+
+    def __init__(self, url: str, prefix: str) -> None:
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "Install the 'redis' package to use CACHE_URL") from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float) -> float:
+        return float(await self._take(keys=[self.prefix + key],
+                                      args=[capacity, rate]))
+
+
+class RateLimiter:
+    """Корзины маркеров одного класса маршрутов."""
+
+    def __init__(self, route_class: str, capacity: int,
+                 period: float) -> None:
+        self.route_class = route_class
+        self.capacity = capacity
+        self.rate = capacity / period
+        if settings.CACHE_URL:
+            self.backend: RateLimitBackend = RedisBackend(
+                settings.CACHE_URL, f"ratelimit:{route_class}:")
+        else:
+            self.backend = MemoryBackend(settings.RATE_LIMIT_KEYS)
+        limiters[route_class] = self
+
+    async def check(self, key: str) -> None:
+        """Пропустить запрос клиента key или отклонить его с 429."""
+        try:
+            retry_after = await self.backend.take(key, self.capacity,
+                                                  self.rate)
+        except Exception as e:
+            # Недоступное хранилище не должно останавливать весь сервис.
+            logger.warning("Rate limit for %s is not checked: %r",
+                           self.route_class, e)
+            return
+        if retry_after > 0:
+            RATE_LIMITED.inc(1, self.route_class)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+limiters: dict[str, RateLimiter] = {}
+
+
+async def client_address(request: Request) -> str:
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+class RateLimit:
+    """Ограничение маршрута: класс и способ получить ключ клиента."""
+
+    def __init__(self, route_class: str, key: KeyFunc) -> None:
+        self.key = key
+        self.limiter = limiters.get(route_class)
+        limit = settings.RATE_LIMITS.get(route_class)
+        if self.limiter is None and limit is not None:
+            self.limiter = RateLimiter(route_class, *limit)
+
+    async def check(self, request: Request) -> None:
+        if self.limiter is not None:
+            await self.limiter.check(await self.key(request))
+
+    async def __call__(self, request: Request) -> None:
+        # Без RateLimitMiddleware проверка остаётся, но уже после
+        # чтения тела.
+        if not request.scope.get("rate_limit_checked"):
+            await self.check(request)
+
+
+def rate_limit(route_class: str, key: KeyFunc = client_address) -> Any:
+    """Зависимость маршрута, ограничивающая частоту запросов клиента.
+
+    Маршруты одного класса делят корзины. Класс, которого нет в
+    RATE_LIMITS, не ограничивается. Ключ вычисляется только по
+    заголовкам и адресу: тело запроса к проверке ещё не прочитано.
+    """
+    return Depends(RateLimit(route_class, key))
+
+
+class RateLimitMiddleware:
+    """ASGI-прослойка, проверяющая ограничения маршрутов до чтения тела.
+
+    Зависимость FastAPI выполняется только после разбора тела, и без
+    прослойки загрузку отклоняли бы с 429, уже приняв её целиком.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._routes: list[tuple[BaseRoute, RateLimit]] | None = None
+
+    def _limited_routes(self, scope: Scope) -> list[tuple[BaseRoute,
+                                                          RateLimit]]:
+        # Маршруты добавляются после создания приложения, поэтому
+        # список собирается при первом запросе.
+        if self._routes is None:
+            self._routes = [
+                (route, dependency.dependency)
+                for route in scope["app"].routes
+                for dependency in getattr(route, "dependencies", ())
+                if isinstance(dependency.dependency, RateLimit)]
+        return self._routes
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        for route, limit in self._limited_routes(scope):
+            if route.matches(scope)[0] != Match.FULL:
+                continue
+            try:
+                await limit.check(Request(scope))
+            except HTTPException as e:
+                response = JSONResponse({"detail": e.detail},
+                                        status_code=e.status_code,
+                                        headers=e.headers)
+                await response(scope, receive, send)
+                return
+            scope["rate_limit_checked"] = True
+            break
+        await self.app(scope, receive, send)
+
+
+class AdmissionMiddleware:
+    """ASGI-прослойка, отклоняющая запросы, когда процесс перегружен."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.in_flight = 0
+
+    def overload(self) -> str | None:
+        """Причина отказа новому запросу или None, если он принимается."""
+        if self.in_flight >= settings.ADMISSION_MAX_IN_FLIGHT:
+            return "in_flight"
+        if get_engine().pool.queue_delay() > settings.ADMISSION_MAX_POOL_WAIT:
+            return "pool_wait"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        reason = self.overload()
+        if reason is not None:
+            REQUESTS_SHED.inc(1, reason)
+            response = JSONResponse(
+                {"detail": "Server is overloaded"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)})
+            await response(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,224 @@
+"""Метрики производительности запросов в текстовом формате Prometheus.
+
+Счётчики и гистограммы живут в памяти процесса. Под gunicorn (server.py)
+у каждого процесса API они свои, а запрос к /metrics попадает в
+случайный процесс и показывает только его. Собирать метрики нужно с
+каждого процесса отдельно (например, по процессу на контейнер) или
+запускать сервер с одним процессом.
+"""
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    """Счётчики одного запроса."""
+
+    statements: int = 0
+    sql_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str,
+                 labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+        registry.append(self)
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} "
+                         f"{value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str,
+                 labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.values: dict[tuple[str, ...], list[float]] = {}
+        registry.append(self)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        # Счётчики по корзинам, затем сумма и количество наблюдений.
+        counts = self.values.setdefault(
+            label_values, [0] * (len(self.buckets) + 3))
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        for label_values, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels((*self.labels, "le"),
+                                 (*label_values, str(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {counts[-2]}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+registry: list[Counter | Histogram] = []
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route.",
+    ("method", "route", "status"))
+REQUEST_SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements", "SQL statements executed per request.",
+    ("method", "route"), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram(
+    "http_request_sql_seconds", "Time spent in SQL per request.",
+    ("method", "route"))
+SQL_STATEMENT_ALARMS = Counter(
+    "http_request_sql_statements_alarm_total",
+    "Requests that executed more than METRICS_SQL_STATEMENTS_ALARM "
+    "statements.", ("method", "route"))
+POOL_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled connection.")
+DB_READS = Counter(
+    "db_read_sessions_total",
+    "Read-only sessions by the database they were routed to.",
+    ("target",))
+RATE_LIMITED = Counter(
+    "rate_limited_total", "Requests rejected by per-client rate limits.",
+    ("route_class",))
+REQUESTS_SHED = Counter(
+    "requests_shed_total", "Requests rejected because the process was "
+    "overloaded.", ("reason",))
+STARTUP_SECONDS = Histogram(
+    "app_startup_seconds", "Time a worker process spent getting ready.",
+    ("phase",))
+UPLOAD_BYTES = Counter(
+    "upload_bytes_total", "Bytes received in file uploads.")
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by result.", ("cache", "result"))
+FEED_RESPONSES = Counter(
+    "feed_cache_responses_total",
+    "Feed pages by how much of them came from the cache.", ("result",))
+EVENTS_PUBLISHED = Counter(
+    "events_published_total", "Events published to the hub.", ("type",))
+EVENTS_DELIVERED = Counter(
+    "events_delivered_total", "Events queued for WebSocket connections.")
+EVENTS_SLOW_CONSUMERS = Counter(
+    "events_slow_consumers_total",
+    "WebSocket connections dropped because their queue was full.")
+JOBS_PROCESSED = Counter(
+    "jobs_processed_total", "Background jobs by outcome.",
+    ("kind", "result"))
+JOB_DURATION = Histogram(
+    "job_duration_seconds", "Background job run time.", ("kind",))
+
+
+def observe_pool_wait(seconds: float) -> None:
+    POOL_WAIT.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подсчитывать выполненные движком запросы в статистике запроса."""
+    event.listen(engine.sync_engine, "before_cursor_execute",
+                 _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute",
+                 _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """ASGI-прослойка, замеряющая каждый HTTP-запрос."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method, path, str(status_code))
+            REQUEST_SQL_STATEMENTS.observe(stats.statements, method, path)
+            REQUEST_SQL_SECONDS.observe(stats.sql_seconds, method, path)
+            if stats.statements > settings.METRICS_SQL_STATEMENTS_ALARM:
+                SQL_STATEMENT_ALARMS.inc(1, method, path)
+                logger.warning("%s %s executed %d SQL statements", method,
+                               path, stats.statements)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in registry
+                     for line in metric.render()) + "\n"
@@ -0,0 +1,84 @@
+"""Перенос файлов, загруженных до появления хэшей, в хранилище по хэшу.
+
+Содержимое сначала копируется в хранилище, затем фиксируется ссылка в
+базе и только после этого удаляется старый файл, поэтому скрипт можно
+безопасно прервать и запустить снова.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import shutil
+import uuid
+from pathlib import Path
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+
+from database import close_database, session_factory
+from files.backends import storage
+from files.images import variant_key
+from files.models import Blob, FileModel
+from files.storage import blob_key
+from settings import settings
+import app
+
+BATCH = 100
+
+
+def hash_file(path: Path) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    with path.open("rb") as f:
+        while chunk := f.read(settings.UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+async def migrate_file(session, file_model: FileModel) -> list[Path]:
+    legacy = settings.PATH_FILES / file_model.get_filename()
+    if not legacy.is_file():
+        print(f"Missing {legacy}, skipped")
+        return []
+    obsolete = [legacy, *(settings.PATH_FILES / variant_key(file_model, size)
+                          for size in settings.IMAGE_SIZES)]
+    digest, size = await run_in_threadpool(hash_file, legacy)
+    if not await storage.exists(blob_key(digest)):
+        tmp_path = settings.PATH_FILES / f".{uuid.uuid4()}.tmp"
+        await run_in_threadpool(shutil.copyfile, legacy, tmp_path)
+        await storage.save(blob_key(digest), tmp_path,
+                           mimetypes.guess_type(legacy.name)[0])
+    await session.execute(
+        pg_insert(Blob).values(digest=digest, size=size, ref_count=1)
+        .on_conflict_do_update(index_elements=[Blob.digest],
+                               set_={"ref_count": Blob.ref_count + 1}))
+    await session.execute(update(FileModel).where(
+        FileModel.uuid == file_model.uuid).values(digest=digest, sizes=[]))
+    return obsolete
+
+
+async def main() -> None:
+    migrated = 0
+    cursor = uuid.UUID(int=0)
+    async with session_factory() as session:
+        while True:
+            files = (await session.scalars(
+                select(FileModel).where(FileModel.digest.is_(None),
+                                        FileModel.uuid > cursor)
+                .order_by(FileModel.uuid).limit(BATCH))).all()
+            if not files:
+                break
+            cursor = files[-1].uuid
+            obsolete = []
+            for file_model in files:
+                obsolete += await migrate_file(session, file_model)
+            await session.commit()
+            for path in obsolete:
+                path.unlink(missing_ok=True)
+            migrated += len(files)
+            print(f"Migrated {migrated} files")
+    await close_database()
+
+
+asyncio.run(main())
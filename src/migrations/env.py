@@ -0,0 +1,52 @@
+"""Окружение alembic: миграции выполняются через асинхронный движок."""
+import asyncio
+
+from alembic import context
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+import app  # noqa: F401
+from database import DATABASE_URL, Base
+
+target_metadata = Base.metadata
+
+# Индексы, которые alembic не умеет сравнивать с отражёнными из базы
+# (например, с COLLATE в выражении); их меняют только вручную.
+_manual_indexes = {index.name for table in target_metadata.tables.values()
+                   for index in table.indexes
+                   if index.info.get("manual_migration")}
+
+
+def include_object(obj, name, type_, reflected, compare_to) -> bool:
+    return not (type_ == "index" and name in _manual_indexes)
+
+
+def run_migrations_offline() -> None:
+    """Генерация SQL-скрипта без подключения к базе (alembic --sql)."""
+    context.configure(url=DATABASE_URL,
+                      target_metadata=target_metadata, literal_binds=True,
+                      dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata,
+                      include_object=include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    """Применение миграций на отдельном движке без пула соединений."""
+    connectable = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
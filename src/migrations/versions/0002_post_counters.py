@@ -0,0 +1,31 @@
+"""post counters
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 15:40:12.418305
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("posts", sa.Column("count_likes", sa.Integer(),
+                                     server_default="0", nullable=False))
+    op.add_column("posts", sa.Column("count_comments", sa.Integer(),
+                                     server_default="0", nullable=False))
+    op.execute(
+        "UPDATE posts SET "
+        "count_likes = (SELECT count(*) FROM likes "
+        "WHERE likes.post_id = posts.id), "
+        "count_comments = (SELECT count(*) FROM comments "
+        "WHERE comments.post_id = posts.id)")
+
+
+def downgrade() -> None:
+    op.drop_column("posts", "count_comments")
+    op.drop_column("posts", "count_likes")
@@ -0,0 +1,56 @@
+"""home timeline
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 15:40:31.902117
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from settings import settings
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("count_subscribers", sa.Integer(),
+                                     server_default="0", nullable=False))
+    op.create_table(
+        "timeline",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("post_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["post_id"], ["posts.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "post_id"),
+    )
+    op.create_index("ix_timeline_user_id_author_id", "timeline",
+                    ["user_id", "author_id"])
+    op.execute(
+        "UPDATE users SET count_subscribers = (SELECT count(*) "
+        "FROM subscribes WHERE subscribes.author_id = users.id)")
+    # Ленты заполняются так же, как при публикации и подписке: свои посты
+    # и последние посты авторов, которые не знаменитости. Статуса у постов
+    # здесь ещё нет: все они опубликованы, и 0009 отметит их готовыми.
+    op.execute("INSERT INTO timeline (user_id, post_id, author_id) "
+               "SELECT author_id, id, author_id FROM posts")
+    op.execute(sa.text(
+        "INSERT INTO timeline (user_id, post_id, author_id) "
+        "SELECT subscribes.subscriber_id, recent.id, recent.author_id "
+        "FROM subscribes JOIN users ON users.id = subscribes.author_id "
+        "CROSS JOIN LATERAL (SELECT id, author_id FROM posts "
+        "WHERE posts.author_id = subscribes.author_id "
+        "ORDER BY id DESC LIMIT :backfill) AS recent "
+        "WHERE users.count_subscribers <= :fanout_limit "
+        "ON CONFLICT DO NOTHING").bindparams(
+        backfill=settings.TIMELINE_BACKFILL,
+        fanout_limit=settings.TIMELINE_FANOUT_LIMIT))
+
+
+def downgrade() -> None:
+    op.drop_table("timeline")
+    op.drop_column("users", "count_subscribers")
@@ -0,0 +1,24 @@
+"""image variants
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:40:47.260593
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("media_files", sa.Column(
+        "sizes", postgresql.ARRAY(sa.String()), server_default="{}",
+        nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column("media_files", "sizes")
@@ -0,0 +1,41 @@
+"""social graph indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:01:48.361966
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_posts_author_id_id", "posts", ["author_id", "id"]),
+    ("ix_media_files_post_id", "media_files", ["post_id"]),
+    ("ix_subscribes_author_id_subscriber_id", "subscribes",
+     ["author_id", "subscriber_id"]),
+    ("ix_comments_post_id_id", "comments", ["post_id", "id"]),
+    ("ix_likes_post_id_user_id", "likes", ["post_id", "user_id"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри
+    # транзакции.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True,
+                            if_not_exists=True)
+        op.drop_index("ix_comments_post_id", table_name="comments",
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index("ix_comments_post_id", "comments", ["post_id"],
+                        postgresql_concurrently=True, if_not_exists=True)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,46 @@
+"""direct messages
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 14:07:30.233057
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("sender_id", sa.Integer(), nullable=False),
+        sa.Column("receiver_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["receiver_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["sender_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_messages_sender_id_receiver_id_id", "messages",
+                    ["sender_id", "receiver_id", "id"])
+    op.create_table(
+        "chats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("peer_id", sa.Integer(), nullable=False),
+        sa.Column("last_message_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["last_message_id"], ["messages.id"]),
+        sa.ForeignKeyConstraint(["peer_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "peer_id"),
+    )
+    op.create_index("ix_chats_user_id_last_message_id", "chats",
+                    ["user_id", "last_message_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("chats")
+    op.drop_table("messages")
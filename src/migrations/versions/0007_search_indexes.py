@@ -0,0 +1,43 @@
+"""search indexes
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 14:12:05.118245
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("posts", sa.Column(
+        "search_vector", postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('russian'::regconfig, "
+                    "coalesce(content, ''))", persisted=True),
+        nullable=False))
+    with op.get_context().autocommit_block():
+        op.create_index("ix_posts_search_vector", "posts", ["search_vector"],
+                        postgresql_using="gin", postgresql_concurrently=True,
+                        if_not_exists=True)
+        op.create_index("ix_users_lower_username_c", "users",
+                        [sa.text('lower(username) COLLATE "C"')],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index("ix_users_fullname_words", "users",
+                        [sa.text("to_tsvector('simple'::regconfig, "
+                                 "fullname)")],
+                        postgresql_using="gin", postgresql_concurrently=True,
+                        if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in ("ix_users_fullname_words",
+                     "ix_users_lower_username_c",
+                     "ix_posts_search_vector"):
+            op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+    op.drop_column("posts", "search_vector")
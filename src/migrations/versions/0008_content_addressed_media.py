@@ -0,0 +1,42 @@
+"""content addressed media
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 14:23:10.997571
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), server_default="0",
+                  nullable=False),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    # Старые файлы остаются без хэша, пока их не перенесёт migrate_media.py.
+    op.add_column("media_files", sa.Column("digest", sa.String(length=64),
+                                           nullable=True))
+    op.create_foreign_key("media_files_digest_fkey", "media_files", "blobs",
+                          ["digest"], ["digest"])
+    with op.get_context().autocommit_block():
+        op.create_index("ix_media_files_digest", "media_files", ["digest"],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_media_files_digest", table_name="media_files",
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_constraint("media_files_digest_fkey", "media_files",
+                       type_="foreignkey")
+    op.drop_column("media_files", "digest")
+    op.drop_table("blobs")
@@ -0,0 +1,60 @@
+"""background jobs
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 14:35:03.927865
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(astext_type=sa.Text()),
+                  nullable=False),
+        sa.Column("idempotency_key", sa.String(), nullable=True),
+        sa.Column("status", sa.String(length=16), server_default="pending",
+                  nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0",
+                  nullable=False),
+        sa.Column("run_at", sa.DateTime(), server_default=sa.text("now()"),
+                  nullable=False),
+        sa.Column("created_at", sa.DateTime(),
+                  server_default=sa.text("now()"), nullable=False),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("idempotency_key"),
+    )
+    op.create_index("ix_jobs_pending_run_at", "jobs", ["run_at"],
+                    postgresql_where=sa.text("status = 'pending'"))
+    # Константное значение по умолчанию не переписывает таблицу постов.
+    op.add_column("posts", sa.Column("status", sa.String(length=16),
+                                     server_default="ready",
+                                     nullable=False))
+    op.add_column("posts", sa.Column("idempotency_key",
+                                     sa.String(length=200), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index("ix_posts_author_id_idempotency_key", "posts",
+                        ["author_id", "idempotency_key"], unique=True,
+                        postgresql_where=sa.text(
+                            "idempotency_key IS NOT NULL"),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_posts_author_id_idempotency_key",
+                      table_name="posts", postgresql_concurrently=True,
+                      if_exists=True)
+    op.drop_column("posts", "idempotency_key")
+    op.drop_column("posts", "status")
+    op.drop_table("jobs")
@@ -0,0 +1,35 @@
+"""refresh tokens
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 14:40:08.644548
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "refresh_tokens",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("family", sa.Uuid(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("revoked", sa.Boolean(), server_default="false",
+                  nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.create_index("ix_refresh_tokens_family", "refresh_tokens",
+                    ["family"])
+    op.create_index("ix_refresh_tokens_user_id", "refresh_tokens",
+                    ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("refresh_tokens")
@@ -0,0 +1,23 @@
+"""unrenderable images
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 18:05:12.408113
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("media_files", sa.Column(
+        "unrenderable", sa.Boolean(), server_default="false",
+        nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column("media_files", "unrenderable")
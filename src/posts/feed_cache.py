@@ -0,0 +1,118 @@
+"""Кэш страниц ленты постов.
+
+Общая для всех зрителей часть поста (текст, файлы, счётчики) хранится
+под номером версии поста, список id на странице — под номером версии
+ленты или автора. Запись меняет номер версии, и следующий запрос
+читает новые данные из базы, а старые записи вытесняются сами. Под
+версионным ключом данные не меняются, поэтому списки и посты лежат в
+памяти процесса, а общими (в Redis при CACHE_URL) должны быть только
+номера версий. Отметка ``liked`` зависит от зрителя и накладывается на
+каждый ответ.
+
+Без общего хранилища новые номера версий рассылаются остальным
+процессам через события (см. events.py), иначе пост, опубликованный
+обработчиком задач, API увидит только по истечении FEED_CACHE_TTL.
+Пост, прочитанный с отстающей реплики уже после смены версии, тоже
+может задержаться в кэше, но не дольше FEED_CACHE_TTL.
+"""
+import asyncio
+import hashlib
+import logging
+import secrets
+from contextlib import suppress
+
+from cache import Cache
+from events import hub
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+FEED = "feed"
+TOPIC = "feed_versions"
+
+versions = Cache("feed_versions", settings.FEED_CACHE_SIZE,
+                 settings.FEED_CACHE_TTL)
+pages = Cache("feed_pages", settings.FEED_CACHE_SIZE,
+              settings.FEED_CACHE_TTL, shared=False)
+posts = Cache("feed_posts", settings.FEED_CACHE_SIZE,
+              settings.FEED_CACHE_TTL, shared=False)
+
+
+def post_key(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def author_key(author_id: int) -> str:
+    return f"author:{author_id}"
+
+
+def _new_version() -> str:
+    # Случайный номер, а не счётчик: после вытеснения или перезапуска
+    # версия не повторит прежнюю и не вернёт устаревшую запись.
+    return secrets.token_hex(8)
+
+
+async def bump(*keys: str) -> None:
+    """Сменить версии после фиксации изменений в базе."""
+    if not keys:
+        return
+    new_versions = {key: _new_version() for key in keys}
+    await versions.set_many(new_versions)
+    if not settings.CACHE_URL:
+        await hub.publish(TOPIC, {"type": TOPIC, "versions": new_versions})
+
+
+async def get_versions(keys: list[str]) -> dict[str, str]:
+    found = await versions.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    await versions.set_many(missing)
+    return found | missing
+
+
+def etag(*parts: object) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(header: str | None, tag: str) -> bool:
+    if header is None:
+        return False
+    return any(candidate.strip().removeprefix("W/") == tag.removeprefix("W/")
+               for candidate in header.split(","))
+
+
+class VersionSync:
+    """Приём новых версий, сменённых другими процессами."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if not settings.CACHE_URL:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                subscription = await hub.connect()
+            except Exception:
+                logger.exception("Could not listen to feed versions")
+                await asyncio.sleep(settings.FEED_CACHE_TTL)
+                continue
+            subscription.subscribe(TOPIC)
+            try:
+                while (event := await subscription.get()) is not None:
+                    await versions.set_many(event.get("versions", {}))
+                # Пропущенные версии устареют сами за FEED_CACHE_TTL.
+                logger.warning("Feed version updates were dropped")
+            finally:
+                subscription.close()
+
+
+version_sync = VersionSync()
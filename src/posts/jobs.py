@@ -0,0 +1,63 @@
+"""Фоновая обработка только что опубликованных постов."""
+from sqlalchemy import literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from events import hub
+from files.images import ensure_variant, is_image
+from files.models import FileModel
+from files.storage import release_files
+from jobs.queue import job_handler
+from posts import feed_cache
+from posts.models import Post, TimelineEntry
+from settings import settings
+from users.models import Subscribe, User
+
+
+async def fan_out(session, post: Post) -> None:
+    """Разложить пост в ленты подписчиков, если автор не знаменитость."""
+    count_subscribers = await session.scalar(
+        select(User.count_subscribers).where(User.id == post.author_id))
+    if count_subscribers > settings.TIMELINE_FANOUT_LIMIT:
+        return
+    await session.execute(pg_insert(TimelineEntry).from_select(
+        ["user_id", "post_id", "author_id"],
+        select(Subscribe.subscriber_id, literal(post.id),
+               literal(post.author_id)).where(
+            Subscribe.author_id == post.author_id),
+    ).on_conflict_do_nothing())
+
+
+async def _post_failed(session, payload: dict) -> None:
+    failed = await session.scalar(update(Post).where(
+        Post.id == payload["post_id"],
+        Post.status == "processing").values(status="failed")
+        .returning(Post.id))
+    if failed is not None:
+        # Неопубликованный пост не показывается, его файлы не нужны.
+        files = await session.scalars(select(FileModel).where(
+            FileModel.post_id == failed))
+        await release_files(session, files.all())
+    await session.commit()
+    await feed_cache.bump(feed_cache.post_key(payload["post_id"]))
+
+
+@job_handler("process_post", on_failure=_post_failed)
+async def process_post(session, payload: dict) -> None:
+    """Подготовить уменьшенные копии, разослать пост и открыть его всем."""
+    post = await session.get(Post, payload["post_id"])
+    if post is None or post.status != "processing":
+        return
+    files = await session.scalars(select(FileModel).where(
+        FileModel.post_id == post.id))
+    for file in files.all():
+        if is_image(file.extension):
+            for size in settings.IMAGE_SIZES:
+                await ensure_variant(session, file, size)
+    await fan_out(session, post)
+    post.status = "ready"
+    await session.commit()
+    await feed_cache.bump(feed_cache.FEED,
+                          feed_cache.author_key(post.author_id),
+                          feed_cache.post_key(post.id))
+    await hub.publish(f"author:{post.author_id}", {
+        "type": "post", "post_id": post.id, "author_id": post.author_id})
@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import Computed, ForeignKey, Index, String, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from database import Base
@@ -9,11 +10,31 @@ from files.models import FileModel
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_author_id_id", "author_id", "id"),
+        Index("ix_posts_search_vector", "search_vector",
+              postgresql_using="gin"),
+        Index("ix_posts_author_id_idempotency_key", "author_id",
+              "idempotency_key", unique=True,
+              postgresql_where=text("idempotency_key IS NOT NULL")),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     content: Mapped[str | None]
     created_at: Mapped[datetime]
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    count_likes: Mapped[int] = mapped_column(default=0, server_default="0")
+    count_comments: Mapped[int] = mapped_column(default=0,
+                                                server_default="0")
+    # processing -> ready или failed, см. posts/jobs.py.
+    status: Mapped[str] = mapped_column(String(16), default="ready",
+                                        server_default="ready")
+    idempotency_key: Mapped[str | None] = mapped_column(String(200))
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed(
+            "to_tsvector('russian'::regconfig, coalesce(content, ''))",
+            persisted=True),
+        deferred=True)
 
     images: Mapped[list[FileModel]] = relationship("FileModel", back_populates="post")
     author: Mapped["User"] = relationship("User", back_populates="posts")
@@ -23,6 +44,9 @@ class Post(Base):
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        Index("ix_likes_post_id_user_id", "post_id", "user_id"),
+    )
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"), primary_key=True)
@@ -30,16 +54,33 @@ class Like(Base):
     user: Mapped["User"] = relationship("User", back_populates="likes")
     post: Mapped["Post"] = relationship("Post", back_populates="likes")
 
+
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index("ix_comments_post_id_id", "post_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     user: Mapped["User"] = relationship("User", back_populates="comments")
 
-    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"), index=True)
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"))
     post: Mapped["Post"] = relationship("Post", back_populates="comments")
 
     content: Mapped[str]
     created_at: Mapped[datetime]
+
+
+class TimelineEntry(Base):
+    __tablename__ = "timeline"
+    __table_args__ = (
+        Index("ix_timeline_user_id_author_id", "user_id", "author_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"),
+                                         primary_key=True)
+    post_id: Mapped[int] = mapped_column(ForeignKey("posts.id"),
+                                         primary_key=True)
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
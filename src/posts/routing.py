@@ -1,13 +1,32 @@
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 
+from limits import rate_limit
+from posts.schemas import CommentsOutputSchema, LatestCommentsSchema, \
+    ResponsePostsSchema
 from posts.services import create_post, like_post, create_comment, \
-    delete_comment, get_posts, get_comments
+    delete_comment, get_posts, get_comments, get_timeline, \
+    get_latest_comments, apply_actions, stream_events
+from users.services import rate_limit_key
 
 router = APIRouter(prefix="/posts", tags=["posts"])
-router.get("/{post_id}/comments/")(get_comments)
-router.get("/")(get_posts)
-router.post("/create/")(create_post)
-router.post("/{post_id}/like/")(like_post)
-router.post("/{post_id}/comments/create")(create_comment)
+# Эти представления сами собирают ответ из строк и кодируют его orjson,
+# схемы указаны только для документации.
+router.get("/{post_id}/comments/", response_model=CommentsOutputSchema,
+           response_class=ORJSONResponse)(get_comments)
+router.get("/comments/latest/", response_model=LatestCommentsSchema,
+           response_class=ORJSONResponse)(get_latest_comments)
+router.get("/", response_model=ResponsePostsSchema,
+           response_class=ORJSONResponse)(get_posts)
+router.get("/timeline/", response_model=ResponsePostsSchema,
+           response_class=ORJSONResponse)(get_timeline)
+router.post("/create/",
+            dependencies=[rate_limit("post", rate_limit_key)])(create_post)
+router.post("/{post_id}/like/",
+            dependencies=[rate_limit("like", rate_limit_key)])(like_post)
+router.post("/actions/",
+            dependencies=[rate_limit("like", rate_limit_key)])(apply_actions)
+router.post("/{post_id}/comments/create", dependencies=[
+    rate_limit("comment", rate_limit_key)])(create_comment)
 router.delete("/{post_id}/comments/{comment_id}")(delete_comment)
-
+router.websocket("/events/")(stream_events)
@@ -1,6 +1,7 @@
 from datetime import datetime
+from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from users.schemas import UserSchema
 
@@ -8,6 +9,7 @@ from users.schemas import UserSchema
 class PostSchema(BaseModel):
     id: int
     images: list[str]
+    image_variants: list[dict[str, str]]
     content: str
     author_id: int
     author_name: str
@@ -15,10 +17,17 @@ class PostSchema(BaseModel):
     count_likes: int
     liked: bool
     count_comments: int
+    status: str
+
+
+class PostStatusSchema(BaseModel):
+    id: int
+    status: str
 
 
 class ResponsePostsSchema(BaseModel):
     posts: list[PostSchema]
+    next_cursor: int | None = None
 
 
 class CommentInputSchema(BaseModel):
@@ -32,9 +41,10 @@ class CommentSchema(BaseModel):
     content: str
     created_at: datetime
 
-class CommentWithUserSchema(BaseModel):
+
+class CommentWithOwnerSchema(BaseModel):
     id: int
-    user: UserSchema
+    user_id: int
     post_id: int
     content: str
     created_at: datetime
@@ -42,4 +52,38 @@ class CommentWithUserSchema(BaseModel):
 
 
 class CommentsOutputSchema(BaseModel):
-    comments: list[CommentWithUserSchema]
+    comments: list[CommentWithOwnerSchema]
+    users: dict[int, UserSchema]
+    next_cursor: int | None = None
+
+
+class LatestCommentsSchema(BaseModel):
+    comments: dict[int, list[CommentWithOwnerSchema]]
+    users: dict[int, UserSchema]
+
+
+class LikeStateSchema(BaseModel):
+    post_id: int
+    liked: bool
+    count_likes: int
+
+
+class ActionSchema(BaseModel):
+    action: Literal["like", "unlike", "subscribe", "unsubscribe"]
+    target_id: int
+
+
+class BulkActionsSchema(BaseModel):
+    actions: list[ActionSchema] = Field(max_length=100)
+
+
+class ActionResultSchema(BaseModel):
+    action: str
+    target_id: int
+    found: bool
+    active: bool
+    count: int | None
+
+
+class BulkActionsResultSchema(BaseModel):
+    results: list[ActionResultSchema]
@@ -1,151 +1,552 @@
-import uuid
+import asyncio
 from datetime import datetime
 from typing import Annotated
 
-from fastapi import Form, UploadFile, HTTPException
-from sqlalchemy.orm import selectinload
+from fastapi import Form, Header, UploadFile, HTTPException, Query, \
+    Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, exists, func, literal, or_, select, true, \
+    union, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from starlette.responses import Response
 
-from database import session_factory
+from database import SessionDep, replicas, session_factory
+from events import Subscription, hub
+from files.images import variant_urls
 from files.models import FileModel
-from posts.models import Like, Post, Comment
-from posts.schemas import CommentInputSchema, CommentSchema, PostSchema, \
-    ResponsePostsSchema, CommentWithUserSchema, CommentsOutputSchema
+from files.storage import StagedFile, acquire_blobs, discard_staged, \
+    publish_staged, stage_upload
+from jobs.queue import enqueue
+from metrics import FEED_RESPONSES
+from posts import feed_cache
+from posts.models import Like, Post, Comment, TimelineEntry
+from posts.schemas import CommentInputSchema, CommentSchema, \
+    PostStatusSchema, LikeStateSchema, BulkActionsSchema, BulkActionsResultSchema, \
+    ActionResultSchema
 from settings import settings
-from users.models import User
-from users.schemas import UserSchema
-from users.services import CurrentUser
-
-
-def get_posts(current_user: CurrentUser, user_id: int | None = None) -> ResponsePostsSchema:
-    with session_factory() as session:
-        query = session.query(Post).options(selectinload(Post.images),
-                                            selectinload(Post.author),
-                                            selectinload(Post.likes))
-
-        if user_id:
-            user = session.query(User).filter(User.id == user_id).first()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            query = query.filter(Post.author_id == user_id)
-        posts = query.all()
-        posts_schemas = [
-            PostSchema(
-                id=post.id,
-                images=list(
-                    map(lambda x: x.get_filename(), post.images)),
-                content=post.content,
-                author_id=post.author.id,
-                author_name=post.author.fullname,
-                created_at=post.created_at,
-                count_likes=len(post.likes),
-                liked=current_user.id in map(lambda x: x.user_id, post.likes),
-                count_comments=len(post.comments)
-            )
-            for post in posts
-        ]
-        return ResponsePostsSchema(posts=posts_schemas)
-
-
-def get_comments(current_user: CurrentUser, post_id: int):
-    with session_factory() as session:
-        comments = session.query(Comment).options(
-            selectinload(Comment.user)).filter(
-            Comment.post_id == post_id).all()
-        comments_schemas = [
-            CommentWithUserSchema(
-                id=comment.id,
-                user=UserSchema(username=comment.user.username,
-                                fullname=comment.user.fullname,
-                                birthday=comment.user.birthday,
-                                signup_at=comment.user.signup_at,
-                                last_activity=comment.user.last_activity,
-                                bio=comment.user.bio,
-                                avatar=comment.user.avatar),
-                post_id = post_id,
-                content=comment.content,
-                created_at=comment.created_at,
-                owner=current_user == comment.user,
-            )
-            for comment in comments
-        ]
-        return CommentsOutputSchema(comments=comments_schemas)
-
-
-async def create_post(current_user: CurrentUser,
+from users.models import Subscribe, User
+from users.services import CurrentUser, ReadCurrentUser, \
+    UserReadSessionDep, get_current_user, publish_subscription, \
+    set_subscription
+
+
+def _visible(current_user: User):
+    # Автор видит свои посты ещё до окончания обработки.
+    return or_(Post.status == "ready", Post.author_id == current_user.id)
+
+
+def _posts_query(current_user: User):
+    liked = exists().where(Like.post_id == Post.id,
+                           Like.user_id == current_user.id)
+    return select(
+        Post.id,
+        Post.content,
+        Post.created_at,
+        Post.author_id,
+        User.fullname.label("author_name"),
+        Post.count_likes,
+        Post.count_comments,
+        Post.status,
+        liked.label("liked"),
+    ).join(User, User.id == Post.author_id).where(_visible(current_user))
+
+
+def _post_item(row, files: list[FileModel]) -> dict:
+    return {
+        "id": row.id,
+        "images": [file.get_filename() for file in files],
+        "image_variants": [variant_urls(file) for file in files],
+        "content": row.content,
+        "author_id": row.author_id,
+        "author_name": row.author_name,
+        "created_at": row.created_at,
+        "count_likes": row.count_likes,
+        "liked": row.liked,
+        "count_comments": row.count_comments,
+        "status": row.status,
+    }
+
+
+async def _build_posts(session, rows) -> list[dict]:
+    """Собрать посты в виде словарей, готовых к сериализации.
+
+    Строки уже приведены к нужным типам базой, поэтому модели pydantic
+    на каждый элемент не создаются: ответ сразу кодируется orjson.
+    """
+    post_ids = [row.id for row in rows]
+    images: dict[int, list[FileModel]] = {post_id: [] for post_id in post_ids}
+    if post_ids:
+        files = await session.scalars(select(FileModel).where(
+            FileModel.post_id.in_(post_ids)))
+        for file in files:
+            images[file.post_id].append(file)
+    return [_post_item(row, images[row.id]) for row in rows]
+
+
+async def _page_ids(session, user_id: int | None, cursor: int | None,
+                    limit: int) -> list[int]:
+    """Id готовых постов страницы, общие для всех зрителей."""
+    list_key = feed_cache.author_key(user_id) if user_id \
+        else feed_cache.FEED
+    version = (await feed_cache.get_versions([list_key]))[list_key]
+    page_key = f"{list_key}:{version}:{cursor}:{limit}"
+    ids = await feed_cache.pages.get(page_key)
+    if ids is not None:
+        return ids
+    query = select(Post.id).where(Post.status == "ready")
+    if user_id:
+        user = await session.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        query = query.where(Post.author_id == user_id)
+    if cursor is not None:
+        query = query.where(Post.id < cursor)
+    ids = list(await session.scalars(
+        query.order_by(Post.id.desc()).limit(limit + 1)))
+    await feed_cache.pages.set(page_key, ids)
+    return ids
+
+
+async def get_posts(request: Request, current_user: ReadCurrentUser,
+                    session: UserReadSessionDep,
+                    user_id: int | None = None,
+                    cursor: int | None = None,
+                    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+                    ) -> Response:
+    """Страница ленты из кэша с учётом отметок зрителя.
+
+    Ответ не меняется, пока не сменились версии постов на странице и
+    отметки зрителя, поэтому клиент с тем же If-None-Match получает 304.
+    """
+    ids = await _page_ids(session, user_id, cursor, limit)
+    if not user_id or user_id == current_user.id:
+        # Свои необработанные посты автор видит, остальные — нет.
+        own = select(Post.id).where(Post.author_id == current_user.id,
+                                    Post.status != "ready")
+        if cursor is not None:
+            own = own.where(Post.id < cursor)
+        ids = sorted({*ids, *await session.scalars(
+            own.order_by(Post.id.desc()).limit(limit + 1))},
+            reverse=True)
+    next_cursor = None
+    if len(ids) > limit:
+        ids = ids[:limit]
+        next_cursor = ids[-1]
+    versions = await feed_cache.get_versions(
+        [feed_cache.post_key(post_id) for post_id in ids])
+    keys = {post_id: f"{post_id}:{versions[feed_cache.post_key(post_id)]}"
+            for post_id in ids}
+    liked = set(await session.scalars(select(Like.post_id).where(
+        Like.user_id == current_user.id, Like.post_id.in_(ids)))) \
+        if ids else set()
+    tag = feed_cache.etag(list(keys.values()), sorted(liked), next_cursor)
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache"}
+    if feed_cache.etag_matches(request.headers.get("if-none-match"), tag):
+        FEED_RESPONSES.inc(1, "not_modified")
+        return Response(status_code=304, headers=headers)
+    items = await feed_cache.posts.get_many(list(keys.values()))
+    missing = [post_id for post_id, key in keys.items() if key not in items]
+    if missing:
+        rows = (await session.execute(_posts_query(current_user).where(
+            Post.id.in_(missing)))).all()
+        loaded = {keys[item["id"]]: item
+                  for item in await _build_posts(session, rows)}
+        await feed_cache.posts.set_many(loaded)
+        items |= loaded
+    FEED_RESPONSES.inc(1, "miss" if missing else "hit")
+    return ORJSONResponse({
+        "posts": [{**items[key], "liked": post_id in liked}
+                  for post_id, key in keys.items() if key in items],
+        "next_cursor": next_cursor,
+    }, headers=headers)
+
+
+async def get_timeline(current_user: ReadCurrentUser,
+                       session: UserReadSessionDep,
+                       cursor: int | None = None,
+                       limit: Annotated[int, Query(ge=1, le=100)] = 20,
+                       ) -> ORJSONResponse:
+    # Видимость проверяется до ограничения каждой ветки: иначе скрытые
+    # посты займут место на странице, и она окончится раньше времени.
+    fanned = select(TimelineEntry.post_id.label("id")).join(
+        Post, Post.id == TimelineEntry.post_id).where(
+        TimelineEntry.user_id == current_user.id, _visible(current_user))
+    celebrities = select(Subscribe.author_id).join(
+        User, User.id == Subscribe.author_id).where(
+        Subscribe.subscriber_id == current_user.id,
+        User.count_subscribers > settings.TIMELINE_FANOUT_LIMIT)
+    pulled = select(Post.id).where(Post.author_id.in_(celebrities),
+                                   Post.status == "ready")
+    if cursor is not None:
+        fanned = fanned.where(TimelineEntry.post_id < cursor)
+        pulled = pulled.where(Post.id < cursor)
+    post_ids = union(
+        fanned.order_by(TimelineEntry.post_id.desc()).limit(limit + 1),
+        pulled.order_by(Post.id.desc()).limit(limit + 1),
+    ).subquery()
+    query = _posts_query(current_user).where(
+        Post.id.in_(select(post_ids.c.id)))
+    rows = (await session.execute(
+        query.order_by(Post.id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return ORJSONResponse({"posts": await _build_posts(session, rows),
+                           "next_cursor": next_cursor})
+
+
+_COMMENT_COLUMNS = (Comment.id, Comment.user_id, Comment.post_id,
+                   Comment.content, Comment.created_at)
+
+
+def _comment_item(current_user: User, row) -> dict:
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "post_id": row.post_id,
+        "content": row.content,
+        "created_at": row.created_at,
+        "owner": current_user.id == row.user_id,
+    }
+
+
+async def _load_users(session, user_ids: set[int]) -> dict[int, dict]:
+    if not user_ids:
+        return {}
+    rows = await session.execute(select(
+        User.id, User.username, User.fullname, User.birthday,
+        User.signup_at, User.last_activity, User.bio, User.avatar,
+    ).where(User.id.in_(user_ids)))
+    return {
+        row.id: {"username": row.username,
+                 "fullname": row.fullname,
+                 "birthday": row.birthday,
+                 "signup_at": row.signup_at,
+                 "last_activity": row.last_activity,
+                 "bio": row.bio,
+                 "avatar": row.avatar}
+        for row in rows
+    }
+
+
+async def get_comments(current_user: ReadCurrentUser,
+                       session: UserReadSessionDep,
+                       post_id: int, cursor: int | None = None,
+                       limit: Annotated[int, Query(ge=1, le=100)] = 20,
+                       ) -> ORJSONResponse:
+    query = select(*_COMMENT_COLUMNS).where(Comment.post_id == post_id)
+    if cursor is not None:
+        query = query.where(Comment.id < cursor)
+    rows = (await session.execute(
+        query.order_by(Comment.id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return ORJSONResponse({
+        "comments": [_comment_item(current_user, row) for row in rows],
+        "users": await _load_users(session, {row.user_id for row in rows}),
+        "next_cursor": next_cursor,
+    })
+
+
+async def get_latest_comments(
+    current_user: ReadCurrentUser, session: UserReadSessionDep,
+    post_ids: Annotated[list[int], Query(max_length=100)],
+    limit: Annotated[int, Query(ge=1, le=20)] = 3,
+) -> ORJSONResponse:
+    posts = select(Post.id).where(Post.id.in_(post_ids)).subquery()
+    latest = select(*_COMMENT_COLUMNS).where(
+        Comment.post_id == posts.c.id).order_by(
+        Comment.id.desc()).limit(limit).lateral()
+    rows = (await session.execute(
+        select(latest).select_from(posts).join(latest, true()))).all()
+    comments: dict[int, list[dict]] = {post_id: [] for post_id in post_ids}
+    for row in rows:
+        comments[row.post_id].append(_comment_item(current_user, row))
+    return ORJSONResponse({
+        "comments": comments,
+        "users": await _load_users(session, {row.user_id for row in rows}),
+    })
+
+
+async def _find_post_by_key(session, author_id: int,
+                            idempotency_key: str) -> PostStatusSchema | None:
+    row = (await session.execute(select(Post.id, Post.status).where(
+        Post.author_id == author_id,
+        Post.idempotency_key == idempotency_key))).first()
+    return None if row is None else PostStatusSchema(id=row.id,
+                                                     status=row.status)
+
+
+async def create_post(current_user: CurrentUser, session: SessionDep,
                       content: Annotated[str, Form()],
-                      files: list[UploadFile]) -> None:
-    with session_factory() as session:
-        post = Post(content=content, created_at=datetime.now(),
-                    author=current_user)
-        session.add(post)
-        session.flush()
+                      files: list[UploadFile],
+                      idempotency_key: Annotated[
+                          str | None, Header(max_length=200)] = None,
+                      ) -> PostStatusSchema:
+    """Сохранить оригиналы и поставить пост в очередь на обработку.
+
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает уже
+    созданный пост.
+    """
+    if idempotency_key is not None:
+        existing = await _find_post_by_key(session, current_user.id,
+                                           idempotency_key)
+        if existing is not None:
+            return existing
+    # Соединение не должно простаивать в транзакции, пока идёт загрузка.
+    await session.commit()
+    staged = []
+    try:
+        budget = settings.MAX_UPLOAD_REQUEST_SIZE
         for file in files:
-            ext = file.filename.split(".")[-1]
-            file_uuid = uuid.uuid4()
-            file_path = settings.PATH_FILES / (str(file_uuid) + "." + ext)
-            file_bytes = await file.read()
-            with file_path.open(mode="wb") as f:
-                f.write(file_bytes)
-            file_model = FileModel(uuid=file_uuid, extension=ext,
-                                   post_id=post.id)
-            session.add(file_model)
-        session.commit()
-
-
-def like_post(current_user: CurrentUser, post_id: int, like: bool) -> Response:
-    with session_factory() as session:
-        user_like = session.query(Like,
-                                  ).filter(
+            staged_file = await stage_upload(
+                file, min(settings.MAX_UPLOAD_FILE_SIZE, budget))
+            budget -= staged_file.size
+            staged.append(staged_file)
+        return await _save_post(session, current_user, content, staged,
+                                idempotency_key)
+    except BaseException:
+        await discard_staged(staged)
+        raise
+
+
+async def _save_post(session, current_user: User, content: str,
+                     staged: list[StagedFile],
+                     idempotency_key: str | None) -> PostStatusSchema:
+    post_id = await session.scalar(pg_insert(Post).values(
+        content=content, created_at=datetime.now(),
+        author_id=current_user.id, status="processing",
+        idempotency_key=idempotency_key,
+    ).on_conflict_do_nothing(
+        index_elements=[Post.author_id, Post.idempotency_key],
+        index_where=Post.idempotency_key.is_not(None),
+    ).returning(Post.id))
+    if post_id is None:
+        # Такой же запрос успел завершиться параллельно.
+        await discard_staged(staged)
+        return await _find_post_by_key(session, current_user.id,
+                                       idempotency_key)
+    await acquire_blobs(session, staged)
+    for file in staged:
+        session.add(FileModel(uuid=file.uuid, extension=file.extension,
+                              post_id=post_id, digest=file.digest))
+    session.add(TimelineEntry(user_id=current_user.id, post_id=post_id,
+                              author_id=current_user.id))
+    await enqueue(session, "process_post", {"post_id": post_id},
+                  idempotency_key=f"process_post:{post_id}")
+    await session.flush()
+    await publish_staged(staged)
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    return PostStatusSchema(id=post_id, status="processing")
+
+
+async def _increment_counter(session, post_id: int, counter,
+                             delta: int) -> int | None:
+    return await session.scalar(
+        update(Post).where(Post.id == post_id).values(
+            {counter: counter + delta}).returning(counter),
+        execution_options={"synchronize_session": False})
+
+
+async def _publish_like(state: LikeStateSchema) -> None:
+    await hub.publish(f"post:{state.post_id}", {
+        "type": "like", "post_id": state.post_id,
+        "count_likes": state.count_likes})
+
+
+async def _set_like(session, user_id: int, post_id: int,
+                    like: bool) -> LikeStateSchema | None:
+    if like:
+        changed = pg_insert(Like).from_select(
+            ["user_id", "post_id"],
+            select(literal(user_id), Post.id).where(Post.id == post_id),
+        ).on_conflict_do_nothing().returning(Like.post_id)
+    else:
+        changed = delete(Like).where(
             Like.post_id == post_id,
-            Like.user_id == current_user.id,
-        ).first()
-        if like and user_like or not like and not user_like:
-            return Response(status_code=200)
-        if not user_like:
-            user_like = Like(post_id=post_id, user_id=current_user.id)
-            session.add(user_like)
-            session.commit()
-            return Response(status_code=200)
-        if user_like:
-            session.delete(user_like)
-            session.commit()
-            return Response(status_code=200)
-
-
-def create_comment(current_user: CurrentUser, post_id: int,
-                   comment: CommentInputSchema) -> CommentSchema:
-    with session_factory() as session:
-        user_comment = Comment(
-            user=current_user,
-            post_id=post_id,
-            content=comment.content,
-            created_at=datetime.now(),
-        )
-        session.add(user_comment)
-        session.commit()
-        return CommentSchema(
-            id=user_comment.id,
-            content=user_comment.content,
-            created_at=user_comment.created_at,
-            user_id=user_comment.user_id,
-            post_id=user_comment.post_id
-        )
-
-
-def delete_comment(current_user: CurrentUser, post_id: int,
-                   comment_id: int) -> Response:
-    with session_factory() as session:
-        comment = session.query(Comment).filter(
-            Comment.id == comment_id).filter(
-            Comment.post_id == post_id
-        ).first()
-        if not comment:
-            raise HTTPException(status_code=404,
-                                detail=f"Comment with id {comment_id} not found")
-        if comment.user_id != current_user.id:
-            raise HTTPException(status_code=403,
-                                detail="You are not permission to delete this comment")
-        session.delete(comment)
-        session.commit()
-        return Response(status_code=204)
+            Like.user_id == user_id,
+        ).returning(Like.post_id)
+    changed = changed.cte("changed")
+    delta = select(func.count()).select_from(changed).scalar_subquery()
+    count_likes = await session.scalar(
+        update(Post).where(Post.id == post_id).values(
+            count_likes=Post.count_likes + (delta if like else -delta),
+        ).returning(Post.count_likes),
+        execution_options={"synchronize_session": False})
+    if count_likes is None:
+        return None
+    return LikeStateSchema(post_id=post_id, liked=like,
+                           count_likes=count_likes)
+
+
+async def like_post(current_user: CurrentUser, session: SessionDep,
+                    post_id: int, like: bool) -> LikeStateSchema:
+    state = await _set_like(session, current_user.id, post_id, like)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    await feed_cache.bump(feed_cache.post_key(post_id))
+    await _publish_like(state)
+    return state
+
+
+async def apply_actions(current_user: CurrentUser, session: SessionDep,
+                        actions: BulkActionsSchema) -> BulkActionsResultSchema:
+    results = []
+    states = []
+    for action in actions.actions:
+        if action.action in ("like", "unlike"):
+            state = await _set_like(session, current_user.id,
+                                    action.target_id, action.action == "like")
+            active, count = (state.liked, state.count_likes) if state \
+                else (False, None)
+        elif action.target_id == current_user.id:
+            state, active, count = None, False, None
+        else:
+            state = await set_subscription(session, current_user.id,
+                                           action.target_id,
+                                           action.action == "subscribe")
+            active, count = (state.subscribed, state.count_subscribers) \
+                if state else (False, None)
+        results.append(ActionResultSchema(
+            action=action.action, target_id=action.target_id,
+            found=state is not None, active=active, count=count))
+        if state is not None:
+            states.append(state)
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    await feed_cache.bump(*(feed_cache.post_key(state.post_id)
+                            for state in states
+                            if isinstance(state, LikeStateSchema)))
+    for state in states:
+        if isinstance(state, LikeStateSchema):
+            await _publish_like(state)
+        else:
+            await publish_subscription(current_user.id, state)
+    return BulkActionsResultSchema(results=results)
+
+
+async def create_comment(current_user: CurrentUser, session: SessionDep,
+                         post_id: int,
+                         comment: CommentInputSchema) -> CommentSchema:
+    user_comment = Comment(
+        user_id=current_user.id,
+        post_id=post_id,
+        content=comment.content,
+        created_at=datetime.now(),
+    )
+    session.add(user_comment)
+    count_comments = await _increment_counter(session, post_id,
+                                              Post.count_comments, 1)
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    await feed_cache.bump(feed_cache.post_key(post_id))
+    result = CommentSchema(
+        id=user_comment.id,
+        content=user_comment.content,
+        created_at=user_comment.created_at,
+        user_id=user_comment.user_id,
+        post_id=user_comment.post_id
+    )
+    await hub.publish(f"post:{post_id}", {
+        "type": "comment", "post_id": post_id,
+        "count_comments": count_comments,
+        "comment": result.model_dump(mode="json")})
+    return result
+
+
+async def delete_comment(current_user: CurrentUser, session: SessionDep,
+                         post_id: int, comment_id: int) -> Response:
+    comment = await session.scalar(select(Comment).where(
+        Comment.id == comment_id).where(
+        Comment.post_id == post_id
+    ))
+    if not comment:
+        raise HTTPException(status_code=404,
+                            detail=f"Comment with id {comment_id} not found")
+    if comment.user_id != current_user.id:
+        raise HTTPException(status_code=403,
+                            detail="You are not permission to delete this comment")
+    await session.delete(comment)
+    count_comments = await _increment_counter(session, post_id,
+                                              Post.count_comments, -1)
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    await feed_cache.bump(feed_cache.post_key(post_id))
+    await hub.publish(f"post:{post_id}", {
+        "type": "comment_deleted", "post_id": post_id,
+        "comment_id": comment_id, "count_comments": count_comments})
+    return Response(status_code=204)
+
+
+async def _receive_watches(websocket: WebSocket,
+                           subscription: Subscription) -> None:
+    watched: set[str] = set()
+    while True:
+        try:
+            message = await websocket.receive_json()
+        except (KeyError, TypeError, ValueError):
+            # Двоичный кадр или текст не в формате JSON.
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+            return
+        post_ids = message.get("watch") if isinstance(message, dict) \
+            else None
+        if not isinstance(post_ids, list):
+            continue
+        topics = {f"post:{post_id}" for post_id in
+                  post_ids[:settings.EVENTS_MAX_WATCHED_POSTS]
+                  if isinstance(post_id, int)}
+        subscription.unsubscribe(*(watched - topics))
+        subscription.subscribe(*(topics - watched))
+        watched = topics
+
+
+async def _send_events(websocket: WebSocket,
+                       subscription: Subscription) -> None:
+    while True:
+        event = await subscription.get()
+        if event is None:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER,
+                                  reason="Events were dropped")
+            return
+        if event["type"] == "subscription":
+            topic = f"author:{event['author_id']}"
+            if event["subscribed"]:
+                subscription.subscribe(topic)
+            else:
+                subscription.unsubscribe(topic)
+        await websocket.send_json(event)
+
+
+async def stream_events(websocket: WebSocket, token: str) -> None:
+    # Сессия нужна только на время подключения, а не на всю его жизнь.
+    async with session_factory() as session:
+        try:
+            user = await get_current_user(token, session)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        author_ids = await session.scalars(select(Subscribe.author_id).where(
+            Subscribe.subscriber_id == user.id))
+        topics = [f"author:{author_id}" for author_id in author_ids]
+    await websocket.accept()
+    subscription = await hub.connect()
+    subscription.subscribe(f"user:{user.id}", *topics)
+    tasks = [asyncio.create_task(_receive_watches(websocket, subscription)),
+             asyncio.create_task(_send_events(websocket, subscription))]
+    try:
+        done, _ = await asyncio.wait(tasks,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect | None):
+                raise task.exception()
+    finally:
+        subscription.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
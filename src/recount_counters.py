@@ -0,0 +1,33 @@
+"""Пересчёт денормализованных счётчиков постов, подписчиков и ссылок."""
+import asyncio
+
+from sqlalchemy import func, select, update
+
+from database import close_database, session_factory
+from files.models import Blob, FileModel
+from posts.models import Comment, Like, Post
+from users.models import Subscribe, User
+import app
+
+count_likes = select(func.count()).where(
+    Like.post_id == Post.id).correlate(Post).scalar_subquery()
+count_comments = select(func.count()).where(
+    Comment.post_id == Post.id).correlate(Post).scalar_subquery()
+count_subscribers = select(func.count()).where(
+    Subscribe.author_id == User.id).correlate(User).scalar_subquery()
+ref_count = select(func.count()).where(
+    FileModel.digest == Blob.digest).correlate(Blob).scalar_subquery()
+
+
+async def main() -> None:
+    async with session_factory() as session:
+        await session.execute(update(Post).values(
+            count_likes=count_likes, count_comments=count_comments))
+        await session.execute(update(User).values(
+            count_subscribers=count_subscribers))
+        await session.execute(update(Blob).values(ref_count=ref_count))
+        await session.commit()
+    await close_database()
+
+
+asyncio.run(main())
@@ -0,0 +1,7 @@
+from fastapi import APIRouter
+
+from search.services import search_posts, search_users
+
+router = APIRouter(prefix="/search", tags=["search"])
+router.get("/users/")(search_users)
+router.get("/posts/")(search_posts)
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class FoundUserSchema(BaseModel):
+    id: int
+    username: str
+    fullname: str
+    avatar: str | None
+    count_subscribers: int
+
+
+class FoundUsersSchema(BaseModel):
+    users: list[FoundUserSchema]
+    next_offset: int | None = None
+
+
+class FoundPostSchema(BaseModel):
+    id: int
+    content: str
+    author_id: int
+    author_name: str
+    created_at: datetime
+    count_likes: int
+    count_comments: int
+    rank: float
+
+
+class FoundPostsSchema(BaseModel):
+    posts: list[FoundPostSchema]
+    next_offset: int | None = None
@@ -0,0 +1,140 @@
+import re
+from typing import Annotated
+
+from fastapi import Query
+from sqlalchemy import and_, func, literal, select, text, union_all
+
+from cache import Cache
+from posts.models import Post
+from search.schemas import FoundPostSchema, FoundPostsSchema, \
+    FoundUserSchema, FoundUsersSchema
+from settings import settings
+from users.models import User
+from users.services import ReadCurrentUser, UserReadSessionDep
+
+search_cache = Cache("search", settings.SEARCH_CACHE_SIZE,
+                     settings.SEARCH_CACHE_TTL)
+
+SearchQuery = Annotated[str, Query(min_length=1, max_length=100)]
+Limit = Annotated[int, Query(ge=1, le=50)]
+Offset = Annotated[int, Query(ge=0, le=settings.SEARCH_MAX_OFFSET)]
+
+# Выражения должны совпадать с выражениями индексов.
+_LOWER_USERNAME = func.lower(User.username).collate("C")
+_FULLNAME_WORDS = func.to_tsvector(text("'simple'::regconfig"),
+                                   User.fullname)
+
+
+def _prefix_upper(prefix: str) -> str | None:
+    """Наименьшая строка больше всех строк с этим префиксом.
+
+    В сортировке "C" строки сравниваются по кодам символов. Символ
+    U+10FFFF увеличить нельзя, а за U+D7FF идут суррогаты, которых в
+    тексте Postgres не бывает. None, если верхней границы нет.
+    """
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return prefix[:-1] + chr(code)
+
+
+def _prefix_range(prefix: str) -> tuple:
+    # Диапазон вместо LIKE с параметром: индекс используется и в общем
+    # плане подготовленного запроса.
+    upper = _prefix_upper(prefix)
+    if upper is None:
+        return _LOWER_USERNAME >= prefix,
+    return _LOWER_USERNAME >= prefix, _LOWER_USERNAME < upper
+
+
+def _words_query(q: str) -> str | None:
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+async def search_users(current_user: ReadCurrentUser,
+                       session: UserReadSessionDep,
+                       q: SearchQuery, limit: Limit = 10,
+                       offset: Offset = 0) -> FoundUsersSchema:
+    q = q.strip().lower()
+    key = f"users:{limit}:{offset}:{q}"
+    cached = await search_cache.get(key)
+    if cached is not None:
+        return FoundUsersSchema.model_validate(cached)
+
+    columns = (User.id, User.username, User.fullname, User.avatar,
+               User.count_subscribers)
+    window = offset + limit + 1
+    branches = []
+    if q:
+        # Совпадения по началу логина идут первыми в порядке индекса.
+        branches.append(select(
+            *columns, literal(0).label("rank_group"),
+            _LOWER_USERNAME.label("sort_name"),
+        ).where(*_prefix_range(q)).order_by(_LOWER_USERNAME).limit(window))
+    words = _words_query(q)
+    if words and len(q) >= settings.SEARCH_MIN_FULLNAME_LENGTH:
+        branches.append(select(
+            *columns, literal(1).label("rank_group"),
+            literal("").label("sort_name"),
+        ).where(
+            _FULLNAME_WORDS.op("@@")(
+                func.to_tsquery(text("'simple'::regconfig"), words)),
+            ~and_(*_prefix_range(q)),
+        ).order_by(User.count_subscribers.desc()).limit(window))
+    rows = []
+    if branches:
+        found = union_all(*branches).subquery()
+        rows = (await session.execute(select(found).order_by(
+            found.c.rank_group, found.c.sort_name,
+            found.c.count_subscribers.desc(), found.c.id,
+        ).offset(offset).limit(limit + 1))).all()
+    result = FoundUsersSchema(
+        users=[FoundUserSchema(id=row.id, username=row.username,
+                               fullname=row.fullname, avatar=row.avatar,
+                               count_subscribers=row.count_subscribers)
+               for row in rows[:limit]],
+        next_offset=offset + limit if len(rows) > limit else None,
+    )
+    await search_cache.set(key, result.model_dump())
+    return result
+
+
+async def search_posts(current_user: ReadCurrentUser,
+                       session: UserReadSessionDep,
+                       q: SearchQuery, limit: Limit = 20,
+                       offset: Offset = 0) -> FoundPostsSchema:
+    q = " ".join(q.split())
+    key = f"posts:{limit}:{offset}:{q.lower()}"
+    cached = await search_cache.get(key)
+    if cached is not None:
+        return FoundPostsSchema.model_validate(cached)
+
+    query = func.websearch_to_tsquery(text("'russian'::regconfig"), q)
+    rank = func.ts_rank_cd(Post.search_vector, query)
+    rows = (await session.execute(select(
+        Post.id, Post.content, Post.author_id,
+        User.fullname.label("author_name"), Post.created_at,
+        Post.count_likes, Post.count_comments, rank.label("rank"),
+    ).join(User, User.id == Post.author_id).where(
+        Post.search_vector.op("@@")(query), Post.status == "ready",
+    ).order_by(rank.desc(), Post.id.desc()).offset(offset).limit(
+        limit + 1))).all()
+    result = FoundPostsSchema(
+        posts=[FoundPostSchema(id=row.id, content=row.content or "",
+                               author_id=row.author_id,
+                               author_name=row.author_name,
+                               created_at=row.created_at,
+                               count_likes=row.count_likes,
+                               count_comments=row.count_comments,
+                               rank=row.rank)
+               for row in rows[:limit]],
+        next_offset=offset + limit if len(rows) > limit else None,
+    )
+    await search_cache.set(key, result.model_dump())
+    return result
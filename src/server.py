@@ -0,0 +1,125 @@
+"""Запуск API в нескольких процессах под gunicorn.
+
+Каждый процесс сам импортирует приложение после fork, поэтому движки
+SQLAlchemy, пулы соединений и потоки у процессов свои; открываются они
+в lifespan приложения (см. app.py) до первого запроса. Процессов по
+умолчанию столько, сколько ядер доступно серверу. DB_MAX_CONNECTIONS
+делится между процессами поровну.
+
+Процесс перезапускается после WEB_MAX_REQUESTS запросов (со случайным
+разбросом, чтобы процессы не перезапускались одновременно), это
+ограничивает рост памяти. По SIGTERM процессы перестают принимать
+подключения, дожидаются начатых запросов не дольше WEB_DRAIN_TIMEOUT и
+закрывают ресурсы.
+
+С репликами (DB_REPLICA_URLS) нескольким процессам нужен CACHE_URL,
+иначе сервер не запускается (см. database.py).
+
+Метрики /metrics у каждого процесса свои и не суммируются (см.
+metrics.py).
+
+    cd src && python server.py --workers 4
+"""
+import argparse
+import logging
+import os
+import time
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Запас на закрытие ресурсов после того, как запросы дождались.
+SHUTDOWN_TIMEOUT = 10
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "timeout_graceful_shutdown": settings.WEB_DRAIN_TIMEOUT,
+    }
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Вызывается в каждом процессе после fork.
+        from metrics import STARTUP_SECONDS
+
+        started = time.perf_counter()
+        from app import app
+        elapsed = time.perf_counter() - started
+        STARTUP_SECONDS.observe(elapsed, "import")
+        logger.info("Process %d imported the app in %.3fs", os.getpid(),
+                    elapsed)
+        return app
+
+
+def default_workers() -> int:
+    return len(os.sched_getaffinity(0))
+
+
+def size_pool(workers: int) -> None:
+    """Поделить DB_MAX_CONNECTIONS между процессами."""
+    if settings.DB_MAX_CONNECTIONS is None:
+        return
+    per_worker = settings.DB_MAX_CONNECTIONS // workers
+    if per_worker < 1:
+        raise SystemExit(f"DB_MAX_CONNECTIONS={settings.DB_MAX_CONNECTIONS} "
+                         f"is less than the number of workers ({workers})")
+    # Процессы унаследуют настройки при fork.
+    settings.DB_POOL_SIZE = per_worker
+    settings.DB_MAX_OVERFLOW = 0
+
+
+def check_replicas(workers: int) -> None:
+    """Чтение своих записей с основной базы требует общего кэша."""
+    if workers > 1 and settings.DB_REPLICA_URLS and not settings.CACHE_URL:
+        raise SystemExit("DB_REPLICA_URLS with several workers requires "
+                         "CACHE_URL: without it a worker does not know "
+                         "about writes made in other workers")
+
+
+def main(args: argparse.Namespace) -> None:
+    check_replicas(args.workers)
+    size_pool(args.workers)
+    logger.info("Starting %d workers, %d database connections each",
+                args.workers,
+                settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
+    Server({
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "server.Worker",
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "graceful_timeout": settings.WEB_DRAIN_TIMEOUT + SHUTDOWN_TIMEOUT,
+        "keepalive": settings.WEB_KEEPALIVE,
+        "forwarded_allow_ips": settings.WEB_FORWARDED_ALLOW_IPS,
+        "preload_app": False,
+    }).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=settings.WEB_BIND)
+    parser.add_argument("--workers", type=int,
+                        default=settings.WEB_WORKERS or default_workers())
+    parser.add_argument("--max-requests", type=int,
+                        default=settings.WEB_MAX_REQUESTS,
+                        help="restart a worker after this many requests, "
+                             "0 to never restart")
+    logging.basicConfig(format="%(asctime)s %(process)d %(levelname)s "
+                               "%(name)s: %(message)s")
+    for name in (__name__, "app"):
+        logging.getLogger(name).setLevel(logging.INFO)
+    main(parser.parse_args())
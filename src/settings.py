@@ -13,10 +13,95 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_NAME: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_MAX_CONNECTIONS: int | None = None
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_MAX_LAG: float = 5
+    DB_REPLICA_CHECK_INTERVAL: float = 2
 
-    SECRET_KEY: str
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_WORKERS: int | None = None
+    WEB_MAX_REQUESTS: int = 10000
+    WEB_DRAIN_TIMEOUT: int = 20
+    WEB_KEEPALIVE: int = 5
+    WEB_WARMUP: bool = True
+    WEB_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+
+    RATE_LIMITS: dict[str, tuple[int, float]] = {
+        "auth": (10, 60), "post": (10, 60), "comment": (30, 60),
+        "like": (120, 60)}
+    RATE_LIMIT_KEYS: int = 100000
+    ADMISSION_MAX_IN_FLIGHT: int = 200
+    ADMISSION_MAX_POOL_WAIT: float = 0.5
+    ADMISSION_RETRY_AFTER: int = 1
+
+    SECRET_KEY: str | None = None
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    JWT_KEY_ID: str | None = None
+    JWT_PRIVATE_KEY_FILE: Path | None = None
+    JWT_PUBLIC_KEYS: dict[str, Path] = {}
+    TOKEN_CACHE_SIZE: int = 100000
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 64
+
+    METRICS_SQL_STATEMENTS_ALARM: int = 10
+
+    CACHE_URL: str | None = None
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 60
+
+    FEED_CACHE_SIZE: int = 10000
+    FEED_CACHE_TTL: float = 60
+
+    TIMELINE_FANOUT_LIMIT: int = 10000
+    TIMELINE_BACKFILL: int = 50
+
+    SEARCH_CACHE_SIZE: int = 10000
+    SEARCH_CACHE_TTL: float = 30
+    SEARCH_MIN_FULLNAME_LENGTH: int = 3
+    SEARCH_MAX_OFFSET: int = 500
+
+    EVENTS_BACKEND: str = "memory"
+    EVENTS_CHANNEL: str = "fotogram_events"
+    EVENTS_QUEUE_SIZE: int = 256
+    EVENTS_MAX_WATCHED_POSTS: int = 100
+    EVENTS_PING_INTERVAL: float = 10
+    EVENTS_RECONNECT_DELAY: float = 0.5
+    EVENTS_RECONNECT_MAX_DELAY: float = 30
+
+    JOBS_EMBEDDED_WORKER: bool = True
+    JOBS_CONCURRENCY: int = 4
+    JOBS_POLL_INTERVAL: float = 1
+    JOBS_LEASE: int = 5 * 60
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_RETRY_DELAY: float = 5
+    JOBS_RETENTION: int = 24 * 60 * 60
+
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_FILE_SIZE: int = 20 * 1024 * 1024
+    MAX_UPLOAD_REQUEST_SIZE: int = 50 * 1024 * 1024
+
+    IMAGE_SIZES: dict[str, int] = {"thumb": 320, "medium": 1080}
+    IMAGE_VARIANT_FORMAT: str = "webp"
+    IMAGE_VARIANT_QUALITY: int = 80
+
+    MEDIA_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60
+    MEDIA_SKIP_DB_LOOKUP: bool = False
+    MEDIA_ACCEL_REDIRECT_PREFIX: str | None = None
+    MEDIA_STORAGE: str = "local"
+    MEDIA_S3_BUCKET: str | None = None
+    MEDIA_S3_ENDPOINT_URL: str | None = None
+    MEDIA_S3_REGION: str | None = None
+    MEDIA_S3_PUBLIC_URL: str | None = None
+    MEDIA_S3_URL_TTL: int = 60 * 60
 
     PATH_FILES_STR: str = "../media_files"
     PATH_FILES: Path = Path(PATH_FILES_STR)
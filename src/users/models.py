@@ -1,8 +1,10 @@
 """Файл моделей ORM для части работы пользователей."""
 from datetime import datetime
+from uuid import UUID
 
-from sqlalchemy import ForeignKey, and_
+from sqlalchemy import ForeignKey, Index, String, and_, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.types import Uuid
 
 from database import Base
 from posts.models import Post
@@ -12,6 +14,16 @@ class User(Base):
     """Модель пользователя."""
 
     __tablename__ = "users"
+    __table_args__ = (
+        # Побайтный порядок "C": диапазон по префиксу и сортировка по
+        # логину обслуживаются одним индексом.
+        Index("ix_users_lower_username_c",
+              text('lower(username) COLLATE "C"'),
+              info={"manual_migration": True}),
+        Index("ix_users_fullname_words",
+              func.to_tsvector(text("'simple'::regconfig"), text("fullname")),
+              postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(index=True, unique=True)
@@ -22,7 +34,8 @@ class User(Base):
     signup_at: Mapped[datetime]
     last_activity: Mapped[datetime]
     avatar: Mapped[str | None]
-
+    count_subscribers: Mapped[int] = mapped_column(default=0,
+                                                   server_default="0")
 
     posts: Mapped[list[Post]] = relationship("Post", back_populates="author")
     likes: Mapped[list["Like"]] = relationship("Like", back_populates="user")
@@ -39,6 +52,10 @@ class User(Base):
 
 class Subscribe(Base):
     __tablename__ = "subscribes"
+    __table_args__ = (
+        Index("ix_subscribes_author_id_subscriber_id", "author_id",
+              "subscriber_id"),
+    )
 
     subscriber_id: Mapped[int] = mapped_column(ForeignKey("users.id"),
                                                primary_key=True)
@@ -50,3 +67,51 @@ class Subscribe(Base):
                                             back_populates="subscribers")
     author: Mapped[User] = relationship("User", foreign_keys=[author_id],
                                         back_populates="subscribes")
+
+
+class Message(Base):
+    """Личное сообщение."""
+
+    __tablename__ = "messages"
+    __table_args__ = (
+        # Оба направления переписки читаются одним диапазоном по индексу.
+        Index("ix_messages_sender_id_receiver_id_id", "sender_id",
+              "receiver_id", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    sender_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    receiver_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    content: Mapped[str]
+    timestamp: Mapped[datetime]
+
+
+class Chat(Base):
+    """Переписка пользователя с собеседником и её последнее сообщение."""
+
+    __tablename__ = "chats"
+    __table_args__ = (
+        Index("ix_chats_user_id_last_message_id", "user_id",
+              "last_message_id"),
+    )
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"),
+                                         primary_key=True)
+    peer_id: Mapped[int] = mapped_column(ForeignKey("users.id"),
+                                         primary_key=True)
+    last_message_id: Mapped[int] = mapped_column(ForeignKey("messages.id"))
+
+
+class RefreshToken(Base):
+    """Токен обновления; в базе хранится только его хэш."""
+
+    __tablename__ = "refresh_tokens"
+
+    digest: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"),
+                                         index=True)
+    # Все токены, выпущенные по цепочке обновлений от одного входа.
+    family: Mapped[UUID] = mapped_column(Uuid, index=True)
+    expires_at: Mapped[datetime]
+    revoked: Mapped[bool] = mapped_column(default=False,
+                                          server_default="false")
@@ -1,14 +1,23 @@
 """Маршруты для пользователей."""
 from fastapi import APIRouter
 
+from limits import rate_limit
 from users.schemas import Token, UserSchema
 from users.services import login_for_access_token, read_users_me, signup, \
-    subscribe, unsubscribe
+    subscribe, unsubscribe, send_message, get_messages, get_chats, \
+    refresh_access_token
 
 router = APIRouter(prefix="/users", tags=["users"])
-router.post("/signup/", response_model=UserSchema)(signup)
-router.post("/login/", response_model=Token)(login_for_access_token)
+router.post("/signup/", response_model=UserSchema,
+            dependencies=[rate_limit("auth")])(signup)
+router.post("/login/", response_model=Token,
+            dependencies=[rate_limit("auth")])(login_for_access_token)
+router.post("/token/refresh/", response_model=Token,
+            dependencies=[rate_limit("auth")])(refresh_access_token)
 router.get("/test/")(read_users_me)
 router.post("/{author_id}/subscribe/")(subscribe)
 router.post("/{author_id}/unsubscribe/")(unsubscribe)
+router.post("/messages/")(send_message)
+router.get("/chats/")(get_chats)
+router.get("/{peer_id}/messages/")(get_messages)
 
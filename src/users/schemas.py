@@ -30,6 +30,14 @@ class Token(BaseModel):
 
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+    expires_in: int | None = None
+
+
+class RefreshSchema(BaseModel):
+    """Запрос нового токена доступа."""
+
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -37,6 +45,14 @@ class TokenData(BaseModel):
 
     username: str | None = None
 
+class SubscribeStateSchema(BaseModel):
+    """Состояние подписки после изменения."""
+
+    author_id: int
+    subscribed: bool
+    count_subscribers: int
+
+
 class SendMessage(BaseModel):
     content: str
     receiver_id: int
@@ -51,3 +67,17 @@ class GetMessage(BaseModel):
 
 class UserChatSchema(UserSchema):
     last_message: GetMessage
+
+
+class MessagesSchema(BaseModel):
+    """Страница истории переписки, от новых сообщений к старым."""
+
+    messages: list[GetMessage]
+    next_cursor: int | None = None
+
+
+class ChatsSchema(BaseModel):
+    """Страница списка переписок, от недавних к давним."""
+
+    chats: list[UserChatSchema]
+    next_cursor: int | None = None
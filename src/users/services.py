@@ -1,180 +1,497 @@
 """Функции для обработки запросов."""
+import asyncio
 import json
-from datetime import UTC, datetime, timedelta
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy import and_
+from sqlalchemy import delete, event, func, insert, inspect, literal, \
+    select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from database import session_factory
+from cache import Cache
+from database import SessionDep, replicas, session_factory
+from events import hub
+from limits import client_address
+from posts.models import Post, TimelineEntry
 from settings import settings
 
-from .models import User, Subscribe
+from .models import Chat, Message, User, Subscribe
 from .schemas import SignUpSchema, Token, UserSchema, SendMessage, \
-    UserChatSchema
+    UserChatSchema, SubscribeStateSchema, GetMessage, MessagesSchema, \
+    ChatsSchema, RefreshSchema
+from .tokens import create_access_token, issue_refresh_token, \
+    rotate_refresh_token, verify_access_token
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__rounds=settings.BCRYPT_ROUNDS)
+# Потоки и очередь проверок паролей создаются в start_hashing() при
+# запуске приложения и убираются в shutdown_hashing() при остановке.
+_hash_executor: ThreadPoolExecutor | None = None
+_hash_slots: asyncio.Semaphore | None = None
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Без CACHE_URL у каждого процесса свой кэш, и изменённый пользователь
+# виден другим процессам прежним, пока запись не устареет через
+# USER_CACHE_TTL.
+user_cache = Cache("users", settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
 
+_CACHED_USER_FIELDS = ("id", "username", "fullname", "birthday", "bio",
+                       "signup_at", "last_activity", "avatar")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
 
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    # Удалять из кэша можно только после фиксации: раньше параллельный
+    # запрос успеет положить туда прежнюю строку.
+    for target in (*session.dirty, *session.deleted):
+        if isinstance(target, User):
+            history = inspect(target).attrs.username.history
+            session.info.setdefault("changed_usernames", set()).update(
+                (target.username, *history.deleted))
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
 
+@event.listens_for(Session, "after_commit")
+def _invalidate_cached_users(session: Session) -> None:
+    for username in session.info.pop("changed_usernames", ()):
+        user_cache.discard(username)
 
-def authenticate_user(username: str, password: str):
-    with (session_factory() as session):
-        user = session.query(User).filter_by(username=username).first()
-        if not user:
-            return None
-        if not verify_password(password, user.password):
-            return None
-        return user
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_usernames", None)
+
+
+def start_hashing() -> None:
+    """Создать потоки для проверки паролей и очередь к ним."""
+    global _hash_executor, _hash_slots
+    _hash_executor = ThreadPoolExecutor(
+        max_workers=settings.PASSWORD_HASH_WORKERS,
+        thread_name_prefix="password-hash")
+    _hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS
+                                    + settings.PASSWORD_HASH_QUEUE)
+
+
+def shutdown_hashing() -> None:
+    """Дождаться начатых проверок паролей и остановить их потоки."""
+    global _hash_executor, _hash_slots
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+    _hash_executor = _hash_slots = None
+
+
+async def _run_hashing(func, *args):
+    # Скрипты и проверки без lifespan получают потоки при первом вызове.
+    if _hash_executor is None:
+        start_hashing()
+    if _hash_slots.locked():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many password checks in progress",
+                            headers={"Retry-After": "1"})
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(
+            _hash_executor, func, *args)
 
 
-def create_access_token(data: dict, expires_delta: int = 15):
-    to_encode = data.copy()
-    expire = datetime.now(UTC) + timedelta(minutes=expires_delta)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY,
-                             algorithm=settings.ALGORITHM)
-    return encoded_jwt
+async def verify_password(plain_password, hashed_password):
+    return await _run_hashing(pwd_context.verify_and_update, plain_password,
+                              hashed_password)
+
+
+async def get_password_hash(password):
+    return await _run_hashing(pwd_context.hash, password)
+
+
+async def authenticate_user(session, username: str, password: str):
+    user = await session.scalar(select(User).filter_by(username=username))
+    # Соединение не должно простаивать в транзакции, пока идёт проверка
+    # пароля: в очереди к хэшированию запрос может ждать секунды.
+    await session.commit()
+    if not user:
+        return None
+    verified, new_hash = await verify_password(password, user.password)
+    if not verified:
+        return None
+    if new_hash:
+        user.password = new_hash
+        await session.commit()
+    return user
 
 
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    session: SessionDep,
 ) -> Token:
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(session, form_data.username,
+                                   form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
+    refresh_token = issue_refresh_token(session, user.id)
+    await session.commit()
+    return _token(user.username, refresh_token)
+
+
+def _token(username: str, refresh_token: str) -> Token:
+    return Token(
+        access_token=create_access_token(
+            data={"sub": username},
+            expires_delta=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        token_type="bearer",
+        refresh_token=refresh_token,
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
     )
-    return Token(access_token=access_token, token_type="bearer")
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+async def refresh_access_token(data: RefreshSchema,
+                               session: SessionDep) -> Token:
+    """Выдать новый токен доступа в обмен на токен обновления."""
+    rotated = await rotate_refresh_token(session, data.refresh_token)
+    username = None if rotated is None else await session.scalar(
+        select(User.username).where(User.id == rotated[0]))
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return _token(username, rotated[1])
+
+
+async def get_user_read_session(
+    token: Annotated[str, Depends(oauth2_scheme)],
+) -> AsyncIterator[AsyncSession]:
+    """Сессия только для чтения от имени владельца токена.
+
+    Пока недавняя запись пользователя может не дойти до реплик, сессия
+    открывается на основной базе.
+    """
+    claims = await verify_access_token(token)
+    factory = await replicas.session_factory(
+        None if claims is None else claims["sub"])
+    async with factory() as session:
+        yield session
+
+
+UserReadSessionDep = Annotated[AsyncSession,
+                               Depends(get_user_read_session)]
+
+
+async def _token_owner(token: str, session, on_replica: bool) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail=json.dumps({"error": "Could not validate credentials"}),
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY,
-                             algorithms=[settings.ALGORITHM])
-        exp: int = payload.get("exp")
-        token_date = datetime.fromtimestamp(exp, UTC)
-        if token_date.replace(tzinfo=UTC) < datetime.now(
-            UTC):
-            raise credentials_exception
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    claims = await verify_access_token(token)
+    if claims is None:
         raise credentials_exception
-    with session_factory() as session:
-        user = session.query(User).filter_by(username=username).first()
-        if user is None:
-            raise credentials_exception
+    username: str = claims["sub"]
+    cached = await user_cache.get(username)
+    if cached is not None:
+        user = User(**cached)
+        make_transient_to_detached(user)
         return user
+    user = await session.scalar(select(User).filter_by(username=username))
+    if user is None and on_replica:
+        # Только что созданный пользователь мог ещё не дойти до реплики.
+        async with session_factory() as primary:
+            user = await primary.scalar(select(User).filter_by(
+                username=username))
+    if user is None:
+        raise credentials_exception
+    await user_cache.set(username, {field: getattr(user, field)
+                                    for field in _CACHED_USER_FIELDS})
+    return user
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
+                           session: SessionDep) -> User:
+    """Владелец токена для обработчиков, изменяющих данные.
+
+    Сессия та же, что у обработчика, поэтому второе соединение не
+    занимается.
+    """
+    return await _token_owner(token, session, on_replica=False)
+
+
+async def get_read_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    session: UserReadSessionDep,
+) -> User:
+    """Владелец токена для обработчиков, которые только читают."""
+    return await _token_owner(token, session,
+                              on_replica=bool(replicas.replicas))
 
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
+ReadCurrentUser = Annotated[User, Depends(get_read_current_user)]
+
+
+async def rate_limit_key(request: Request) -> str:
+    """Ключ ограничения частоты: владелец токена или адрес клиента."""
+    claims = await verify_access_token(await oauth2_scheme(request))
+    if claims is None:
+        return await client_address(request)
+    return f"user:{claims['sub']}"
 
 
 async def read_users_me(
-    current_user: CurrentUser,
+    current_user: ReadCurrentUser,
 ):
     return Response(status_code=200,
                     content=current_user.fullname + " " + current_user.birthday.strftime(
                         "%B %d, %Y"))
 
 
-def signup(ud: SignUpSchema) -> Response | UserSchema:
+def _username_taken() -> Response:
+    return Response(status_code=status.HTTP_400_BAD_REQUEST,
+                    content=json.dumps({"error": "Username already taken"}))
+
+
+async def signup(ud: SignUpSchema,
+                 session: SessionDep) -> Response | UserSchema:
     if ud.password != ud.password_repeat:
         return Response(status_code=status.HTTP_400_BAD_REQUEST,
                         content=json.dumps({"error": "Passwords must match"}))
-    with session_factory() as session:
+    try:
+        old_user = await session.scalar(select(User.id).filter_by(
+            username=ud.username))
+        # Хэш считается уже без открытой транзакции.
+        await session.commit()
+        if old_user is not None:
+            return _username_taken()
+        user = User(
+            username=ud.username,
+            fullname=ud.fullname,
+            password=await get_password_hash(ud.password),
+            birthday=ud.birthday,
+            bio=ud.bio,
+            signup_at=datetime.now(),
+            last_activity=datetime.now(),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return Response(status_code=status.HTTP_400_BAD_REQUEST,
+                        content=json.dumps(
+                            {"error": f"Error creating user {e}"}))
+    else:
+        session.add(user)
         try:
-            old_user = session.query(User).filter_by(
-                username=ud.username).first()
-            if old_user is not None:
-                return Response(status_code=status.HTTP_400_BAD_REQUEST,
-                                content=json.dumps(
-                                    {"error": "Username already taken"}))
-            print(old_user)
-            user = User(
-                username=ud.username,
-                fullname=ud.fullname,
-                password=get_password_hash(ud.password),
-                birthday=ud.birthday,
-                bio=ud.bio,
-                signup_at=datetime.now(),
-                last_activity=datetime.now(),
-            )
-        except Exception as e:
-            return Response(status_code=status.HTTP_400_BAD_REQUEST,
-                            content=json.dumps(
-                                {"error": f"Error creating user {e}"}))
-        else:
-            session.add(user)
-            session.commit()
-            ur = UserSchema(
-                id=user.id,
-                username=user.username,
-                fullname=user.fullname,
-                signup_at=user.signup_at,
-                bio=user.bio,
-                last_activity=user.last_activity,
-                avatar=user.avatar,
-                birthday=user.birthday,
-            )
-            return ur
-
-
-def subscribe(current_user: CurrentUser, author_id: int) -> Response:
-    with session_factory() as session:
-        author = session.query(User).filter_by(id=author_id).first()
-        if author is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail="Author not found")
-        current_subscribe = session.query(Subscribe).filter(
-            and_(Subscribe.subscriber == current_user,
-                 Subscribe.author == author)).first()
-        if not current_subscribe:
-            current_subscribe = Subscribe(author=author,
-                                          subscriber=current_user)
-            session.add(current_subscribe)
-            session.commit()
-        return Response(status_code=status.HTTP_200_OK)
-
-
-def unsubscribe(current_user: CurrentUser, author_id: int) -> Response:
-    with session_factory() as session:
-        author = session.query(User).filter_by(id=author_id).first()
-        if author is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail="Author not found")
-        current_subscribe = session.query(Subscribe).filter(
-            Subscribe.author == author).filter(
-            Subscribe.subscriber == current_user).first()
-        if current_subscribe:
-            session.delete(current_subscribe)
-            session.commit()
-        return Response(status_code=status.HTTP_200_OK)
+            await session.commit()
+        except IntegrityError:
+            # Логин успели занять, пока считался хэш.
+            await session.rollback()
+            return _username_taken()
+        ur = UserSchema(
+            id=user.id,
+            username=user.username,
+            fullname=user.fullname,
+            signup_at=user.signup_at,
+            bio=user.bio,
+            last_activity=user.last_activity,
+            avatar=user.avatar,
+            birthday=user.birthday,
+        )
+        return ur
+
+
+async def _backfill_timeline(session, user_id: int, author_id: int) -> None:
+    recent_posts = select(
+        literal(user_id), Post.id, Post.author_id).where(
+        Post.author_id == author_id, Post.status == "ready").order_by(
+        Post.id.desc()).limit(settings.TIMELINE_BACKFILL)
+    await session.execute(pg_insert(TimelineEntry).from_select(
+        ["user_id", "post_id", "author_id"], recent_posts,
+    ).on_conflict_do_nothing())
+
+
+async def set_subscription(session, subscriber_id: int, author_id: int,
+                           subscribed: bool) -> SubscribeStateSchema | None:
+    if subscribed:
+        changed = pg_insert(Subscribe).from_select(
+            ["subscriber_id", "author_id"],
+            select(literal(subscriber_id), User.id).where(
+                User.id == author_id),
+        ).on_conflict_do_nothing().returning(Subscribe.author_id)
+    else:
+        changed = delete(Subscribe).where(
+            Subscribe.subscriber_id == subscriber_id,
+            Subscribe.author_id == author_id,
+        ).returning(Subscribe.author_id)
+    changed = changed.cte("changed")
+    delta = select(func.count()).select_from(changed).scalar_subquery()
+    query = update(User).where(User.id == author_id).values(
+        count_subscribers=User.count_subscribers + (
+            delta if subscribed else -delta),
+    ).returning(User.count_subscribers, delta)
+    if not subscribed:
+        query = query.add_cte(delete(TimelineEntry).where(
+            TimelineEntry.user_id == subscriber_id,
+            TimelineEntry.author_id.in_(select(changed.c.author_id)),
+        ).cte("pruned"))
+    row = (await session.execute(
+        query, execution_options={"synchronize_session": False})).first()
+    if row is None:
+        return None
+    count_subscribers, changed_count = row
+    if changed_count and subscribed \
+            and count_subscribers <= settings.TIMELINE_FANOUT_LIMIT:
+        await _backfill_timeline(session, subscriber_id, author_id)
+    return SubscribeStateSchema(author_id=author_id, subscribed=subscribed,
+                                count_subscribers=count_subscribers)
+
+
+async def publish_subscription(subscriber_id: int,
+                               state: SubscribeStateSchema) -> None:
+    """Сообщить открытым подключениям подписчика о смене подписки."""
+    await hub.publish(f"user:{subscriber_id}", {
+        "type": "subscription",
+        "author_id": state.author_id,
+        "subscribed": state.subscribed,
+    })
+
+
+async def _change_subscription(current_user: User, session,
+                               author_id: int,
+                               subscribed: bool) -> SubscribeStateSchema:
+    state = await set_subscription(session, current_user.id, author_id,
+                                   subscribed)
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Author not found")
+    await replicas.mark_written(current_user.username)
+    await session.commit()
+    await publish_subscription(current_user.id, state)
+    return state
+
+
+async def subscribe(current_user: CurrentUser, session: SessionDep,
+                    author_id: int) -> SubscribeStateSchema:
+    if author_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Can not subscribe to yourself")
+    return await _change_subscription(current_user, session, author_id, True)
+
+
+async def unsubscribe(current_user: CurrentUser, session: SessionDep,
+                      author_id: int) -> SubscribeStateSchema:
+    return await _change_subscription(current_user, session, author_id,
+                                      False)
+
+
+_MESSAGE_COLUMNS = (Message.id, Message.sender_id, Message.receiver_id,
+                    Message.content, Message.timestamp)
+
+
+def _message_schema(row) -> GetMessage:
+    return GetMessage(id=row.id, sender_id=row.sender_id,
+                      receiver_id=row.receiver_id, content=row.content,
+                      timestamp=row.timestamp)
+
+
+async def send_message(current_user: CurrentUser, session: SessionDep,
+                       message: SendMessage) -> GetMessage:
+    if message.receiver_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Can not send a message to yourself")
+    created = insert(Message).from_select(
+        ["sender_id", "receiver_id", "content", "timestamp"],
+        select(literal(current_user.id), User.id, literal(message.content),
+               literal(datetime.now())).where(
+            User.id == message.receiver_id),
+    ).returning(*_MESSAGE_COLUMNS).cte("created")
+    # Обе стороны переписки получают ссылку на последнее сообщение в
+    # том же запросе, что и вставка.
+    chats = pg_insert(Chat).from_select(
+        ["user_id", "peer_id", "last_message_id"],
+        union_all(
+            select(created.c.sender_id, created.c.receiver_id,
+                   created.c.id),
+            select(created.c.receiver_id, created.c.sender_id,
+                   created.c.id),
+        ))
+    chats = chats.on_conflict_do_update(
+        index_elements=[Chat.user_id, Chat.peer_id],
+        set_={"last_message_id": chats.excluded.last_message_id},
+        where=Chat.last_message_id < chats.excluded.last_message_id,
+    ).cte("chats")
+    row = (await session.execute(
+        select(created).add_cte(chats))).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Receiver not found")
+    await session.commit()
+    result = _message_schema(row)
+    payload = {"type": "message",
+               "message": result.model_dump(mode="json")}
+    await hub.publish(f"user:{result.receiver_id}", payload)
+    await hub.publish(f"user:{result.sender_id}", payload)
+    return result
 
 
+async def get_messages(current_user: CurrentUser, session: SessionDep,
+                       peer_id: int, cursor: int | None = None,
+                       limit: Annotated[int, Query(ge=1, le=100)] = 50,
+                       ) -> MessagesSchema:
+    directions = []
+    for sender_id, receiver_id in ((current_user.id, peer_id),
+                                   (peer_id, current_user.id)):
+        query = select(*_MESSAGE_COLUMNS).where(
+            Message.sender_id == sender_id,
+            Message.receiver_id == receiver_id)
+        if cursor is not None:
+            query = query.where(Message.id < cursor)
+        directions.append(
+            query.order_by(Message.id.desc()).limit(limit + 1))
+    messages = union_all(*directions).subquery()
+    rows = (await session.execute(select(messages).order_by(
+        messages.c.id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return MessagesSchema(messages=[_message_schema(row) for row in rows],
+                          next_cursor=next_cursor)
 
 
+async def get_chats(current_user: CurrentUser, session: SessionDep,
+                    cursor: int | None = None,
+                    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+                    ) -> ChatsSchema:
+    query = select(
+        *_MESSAGE_COLUMNS, User.username, User.fullname, User.birthday,
+        User.signup_at, User.last_activity, User.bio, User.avatar,
+    ).select_from(Chat).join(
+        Message, Message.id == Chat.last_message_id).join(
+        User, User.id == Chat.peer_id).where(Chat.user_id == current_user.id)
+    if cursor is not None:
+        query = query.where(Chat.last_message_id < cursor)
+    rows = (await session.execute(query.order_by(
+        Chat.last_message_id.desc()).limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return ChatsSchema(chats=[
+        UserChatSchema(username=row.username,
+                       fullname=row.fullname,
+                       birthday=row.birthday,
+                       signup_at=row.signup_at,
+                       last_activity=row.last_activity,
+                       bio=row.bio,
+                       avatar=row.avatar,
+                       last_message=_message_schema(row))
+        for row in rows
+    ], next_cursor=next_cursor)
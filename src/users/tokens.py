@@ -0,0 +1,137 @@
+"""Выпуск и проверка токенов доступа и обновления.
+
+Токены доступа — короткоживущие JWT. При симметричном алгоритме (HS256)
+их подписывают и проверяют общим SECRET_KEY. При асимметричном (ES256,
+RS256) подписывают только узлы с закрытым ключом JWT_PRIVATE_KEY_FILE,
+остальные проверяют подпись открытыми ключами JWT_PUBLIC_KEYS по kid из
+заголовка токена. Смена ключа: новый открытый ключ добавляют на все
+узлы, затем переключают JWT_KEY_ID и закрытый ключ, а старый открытый
+ключ убирают, когда истекут подписанные им токены.
+
+    openssl ecparam -name prime256v1 -genkey -noout \\
+        | openssl pkcs8 -topk8 -nocrypt -out jwt-2026-10.pem
+    openssl ec -in jwt-2026-10.pem -pubout -out jwt-2026-10.pub.pem
+
+Проверенный токен кэшируется по хэшу до своего exp, поэтому повторная
+проверка сводится к поиску в словаре.
+
+Токены обновления — случайные строки, в базе хранится их хэш. Каждое
+обновление гасит предъявленный токен и выдаёт следующий в той же
+цепочке; повторное предъявление погашенного токена гасит всю цепочку.
+"""
+import hashlib
+import secrets
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from jose import JWTError, jwk, jwt
+from sqlalchemy import select, update
+
+from cache import Cache
+from settings import settings
+
+from .models import RefreshToken
+
+token_cache = Cache("tokens", settings.TOKEN_CACHE_SIZE, ttl=0,
+                    shared=False)
+
+
+def _load_keys():
+    if settings.ALGORITHM.startswith("HS"):
+        return settings.SECRET_KEY, {}
+    public_keys = {kid: jwk.construct(path.read_text(), settings.ALGORITHM)
+                   for kid, path in settings.JWT_PUBLIC_KEYS.items()}
+    signing_key = None
+    if settings.JWT_PRIVATE_KEY_FILE is not None:
+        signing_key = jwk.construct(
+            settings.JWT_PRIVATE_KEY_FILE.read_text(), settings.ALGORITHM)
+        public_keys.setdefault(settings.JWT_KEY_ID, signing_key.public_key())
+    return signing_key, public_keys
+
+
+_signing_key, _public_keys = _load_keys()
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_access_token(data: dict, expires_delta: int = 15) -> str:
+    if _signing_key is None:
+        raise RuntimeError("This node has no key to sign tokens")
+    expire = datetime.now(UTC) + timedelta(minutes=expires_delta)
+    headers = {"kid": settings.JWT_KEY_ID} if settings.JWT_KEY_ID else None
+    return jwt.encode({**data, "exp": expire}, _signing_key,
+                      algorithm=settings.ALGORITHM, headers=headers)
+
+
+def _verification_key(token: str):
+    if settings.ALGORITHM.startswith("HS"):
+        return settings.SECRET_KEY
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = _public_keys.get(kid)
+    if key is None:
+        raise JWTError(f"Unknown key id {kid!r}")
+    return key
+
+
+async def verify_access_token(token: str) -> dict[str, Any] | None:
+    """Утверждения проверенного токена или None, если токен негоден."""
+    key = _digest(token)
+    claims = await token_cache.get(key)
+    if claims is not None:
+        return claims
+    try:
+        # python-jose сама проверяет exp, если он есть в токене.
+        claims = jwt.decode(token, _verification_key(token),
+                            algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if "exp" not in claims or "sub" not in claims:
+        return None
+    await token_cache.set(key, claims, ttl=claims["exp"] - time.time())
+    return claims
+
+
+def issue_refresh_token(session, user_id: int,
+                        family: uuid.UUID | None = None) -> str:
+    """Добавить в сессию новый токен обновления и вернуть его."""
+    token = secrets.token_urlsafe(32)
+    session.add(RefreshToken(
+        digest=_digest(token), user_id=user_id,
+        family=family or uuid.uuid4(),
+        expires_at=datetime.now() + timedelta(
+            days=settings.REFRESH_TOKEN_EXPIRE_DAYS)))
+    return token
+
+
+async def rotate_refresh_token(session,
+                               token: str) -> tuple[int, str] | None:
+    """Погасить токен обновления и выдать следующий в той же цепочке.
+
+    Returns
+    -------
+        tuple[int, str] | None: id пользователя и новый токен или None,
+        если токен неизвестен, истёк или уже погашен.
+
+    """
+    digest = _digest(token)
+    row = (await session.execute(update(RefreshToken).where(
+        RefreshToken.digest == digest, ~RefreshToken.revoked,
+        RefreshToken.expires_at > datetime.now(),
+    ).values(revoked=True).returning(RefreshToken.user_id,
+                                     RefreshToken.family))).first()
+    if row is None:
+        # Погашенный токен предъявили ещё раз: скорее всего, его украли.
+        family = await session.scalar(select(RefreshToken.family).where(
+            RefreshToken.digest == digest, RefreshToken.revoked))
+        if family is not None:
+            await session.execute(update(RefreshToken).where(
+                RefreshToken.family == family).values(revoked=True))
+            await session.commit()
+        return None
+    new_token = issue_refresh_token(session, row.user_id, row.family)
+    await session.commit()
+    return row.user_id, new_token
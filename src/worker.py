@@ -0,0 +1,37 @@
+"""Процесс, выполняющий фоновые задачи из очереди в Postgres.
+
+Процессов можно запустить сколько угодно: задачи распределяются между
+ними через SKIP LOCKED. Процессу API тогда стоит выключить встроенный
+обработчик (JOBS_EMBEDDED_WORKER=false).
+
+    cd src && python worker.py --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from database import close_database
+from events import hub
+from jobs.queue import Worker
+from settings import settings
+import app
+
+
+async def main(concurrency: int) -> None:
+    settings.PATH_FILES.mkdir(parents=True, exist_ok=True)
+    worker = Worker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.request_stop)
+    await worker.run()
+    await hub.close()
+    await close_database()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int,
+                        default=settings.JOBS_CONCURRENCY)
+    logging.basicConfig()
+    asyncio.run(main(parser.parse_args().concurrency))